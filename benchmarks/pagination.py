@@ -0,0 +1,95 @@
+"""Compare the offset and deferred join pagination strategies on deep pages of a generated SQLite table.
+
+Usage: PYTHONPATH=. python benchmarks/pagination.py [--rows 1000000] [--size 30] [--repeat 5]
+"""
+import argparse
+import timeit
+
+from flask import Flask
+from marshmallow_jsonapi import fields
+from marshmallow_jsonapi.flask import Schema
+from sqlalchemy import Column, Integer, String, Text, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from flask_combo_jsonapi import Api, ResourceDetail, ResourceList
+
+Base = declarative_base()
+
+
+class Article(Base):
+    __tablename__ = 'article'
+
+    id = Column(Integer, primary_key=True)
+    rank = Column(Integer, index=True)
+    title = Column(String)
+    body = Column(Text)
+
+
+class ArticleSchema(Schema):
+    class Meta:
+        type_ = 'article'
+        self_view = 'article_detail'
+        self_view_kwargs = {'id': '<id>'}
+
+    id = fields.Integer(as_string=True)
+    rank = fields.Integer()
+    title = fields.Str()
+    body = fields.Str()
+
+
+def create_app(session):
+    app = Flask(__name__)
+    api = Api(app)
+
+    class ArticleList(ResourceList):
+        schema = ArticleSchema
+        data_layer = {'session': session, 'model': Article, 'count_mode': 'none'}
+
+    class ArticleDetail(ResourceDetail):
+        schema = ArticleSchema
+        data_layer = {'session': session, 'model': Article}
+
+    api.route(ArticleList, 'article_list', '/articles')
+    api.route(ArticleDetail, 'article_detail', '/articles/<int:id>')
+    return app, ArticleList
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--size', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    body = 'lorem ipsum dolor sit amet ' * 40
+    with engine.begin() as connection:
+        for start in range(0, args.rows, 50000):
+            connection.execute(Article.__table__.insert(), [
+                {'id': i + 1, 'rank': (i * 7919) % args.rows, 'title': 'article {}'.format(i), 'body': body}
+                for i in range(start, min(start + 50000, args.rows))
+            ])
+    session = sessionmaker(bind=engine)()
+
+    app, article_list = create_app(session)
+    client = app.test_client()
+    last_page = args.rows // args.size
+    for number in (1, last_page // 10, last_page // 2, last_page):
+        url = '/articles?sort=rank&page[size]={}&page[number]={}'.format(args.size, number)
+        timings = {}
+        documents = {}
+        for strategy in ('offset', 'deferred_join'):
+            article_list._data_layer.pagination_strategy = strategy
+            documents[strategy] = client.get(url).get_data()
+            timings[strategy] = min(timeit.repeat(lambda: client.get(url), number=1, repeat=args.repeat))
+        assert documents['offset'] == documents['deferred_join']
+        print('page {:>7} of {}  offset: {:8.2f} ms  deferred join: {:8.2f} ms  speedup: x{:.2f}'.format(
+            number, last_page, timings['offset'] * 1000, timings['deferred_join'] * 1000,
+            timings['offset'] / timings['deferred_join']
+        ))
+
+
+if __name__ == '__main__':
+    main()
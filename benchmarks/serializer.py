@@ -0,0 +1,137 @@
+"""Compare the dump of a computed schema with its compiled serializer on pages of 1000 rows.
+
+Usage: PYTHONPATH=. python benchmarks/serializer.py [--rows 1000] [--repeat 20]
+"""
+import argparse
+import json
+import timeit
+
+from flask import Flask
+from marshmallow_jsonapi import fields
+from marshmallow_jsonapi.flask import Schema, Relationship
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Boolean, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, sessionmaker
+
+from flask_combo_jsonapi import Api, ResourceDetail, ResourceList
+from flask_combo_jsonapi.querystring import QueryStringManager
+from flask_combo_jsonapi.schema import compute_schema
+from flask_combo_jsonapi.serializer import compile_serializer
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    email = Column(String)
+    age = Column(Integer)
+    active = Column(Boolean)
+    birth_date = Column(DateTime)
+    computers = relationship('Computer', backref='person')
+
+
+class Computer(Base):
+    __tablename__ = 'computer'
+
+    id = Column(Integer, primary_key=True)
+    serial = Column(String)
+    person_id = Column(Integer, ForeignKey('person.id'))
+
+
+class PersonSchema(Schema):
+    class Meta:
+        type_ = 'person'
+        self_view = 'person_detail'
+        self_view_kwargs = {'id': '<id>'}
+
+    id = fields.Integer(as_string=True)
+    name = fields.Str()
+    email = fields.Str()
+    age = fields.Integer()
+    active = fields.Boolean()
+    birth_date = fields.DateTime()
+    computers = Relationship(related_view='computer_list',
+                             related_view_kwargs={'id': '<id>'},
+                             schema='ComputerSchema',
+                             type_='computer',
+                             many=True)
+
+
+class ComputerSchema(Schema):
+    class Meta:
+        type_ = 'computer'
+        self_view = 'computer_detail'
+        self_view_kwargs = {'id': '<id>'}
+
+    id = fields.Integer(as_string=True)
+    serial = fields.Str()
+
+
+def create_app(session):
+    app = Flask(__name__)
+    api = Api(app)
+
+    class PersonList(ResourceList):
+        schema = PersonSchema
+        data_layer = {'session': session, 'model': Person}
+
+    class PersonDetail(ResourceDetail):
+        schema = PersonSchema
+        data_layer = {'session': session, 'model': Person}
+
+    class ComputerList(ResourceList):
+        schema = ComputerSchema
+        data_layer = {'session': session, 'model': Computer}
+
+    class ComputerDetail(ResourceDetail):
+        schema = ComputerSchema
+        data_layer = {'session': session, 'model': Computer}
+
+    api.route(PersonList, 'person_list', '/persons')
+    api.route(PersonDetail, 'person_detail', '/persons/<int:id>')
+    api.route(ComputerList, 'computer_list', '/persons/<int:id>/computers')
+    api.route(ComputerDetail, 'computer_detail', '/computers/<int:id>')
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all(
+        Person(name='person {}'.format(i), email='person{}@example.com'.format(i), age=i % 90, active=bool(i % 2),
+               computers=[Computer(serial='serial {}'.format(i))])
+        for i in range(args.rows)
+    )
+    session.commit()
+    persons = session.query(Person).all()
+    for person in persons:
+        person.computers
+
+    app = create_app(session)
+    for query_string in ({}, {'include': 'computers'}):
+        with app.test_request_context('/persons', query_string=query_string):
+            qs = QueryStringManager(query_string, PersonSchema)
+            schema = compute_schema(PersonSchema, {'many': True}, qs, qs.include)
+            compiled_schema = compute_schema(PersonSchema, {'many': True}, qs, qs.include, compiled=True)
+            compile_serializer(compiled_schema)
+
+            assert json.dumps(schema.dump(persons)) == json.dumps(compiled_schema.dump(persons))
+            marshmallow = min(timeit.repeat(lambda: schema.dump(persons), number=1, repeat=args.repeat))
+            compiled = min(timeit.repeat(lambda: compiled_schema.dump(persons), number=1, repeat=args.repeat))
+            print('{:<20} {} rows  marshmallow: {:7.2f} ms  compiled: {:7.2f} ms  speedup: x{:.2f}'.format(
+                'include=computers' if query_string else 'no include', args.rows, marshmallow * 1000,
+                compiled * 1000, marshmallow / compiled
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,12 @@ from functools import wraps
 from flask import request, abort
 
 from flask_combo_jsonapi.decorators import jsonapi_exception_formatter
+from flask_combo_jsonapi.encoders import get_encoder
 from flask_combo_jsonapi.exceptions import PluginMethodNotImplementedError
+from flask_combo_jsonapi.pagination import check_cursor_pagination
+from flask_combo_jsonapi.plan import compile_resource_plan
+from flask_combo_jsonapi.plugin import build_plugin_hooks
+from flask_combo_jsonapi.schema import index_schema_types
 from flask_combo_jsonapi.resource import ResourceList, ResourceRelationship
 
 
@@ -63,10 +68,15 @@ class Api(object):
                 self.app.register_blueprint(blueprint)
 
         self.app.config.setdefault('PAGE_SIZE', 30)
+        # the JSON encoder is checked once here rather than when the first response is serialized
+        get_encoder(self.app)
 
-        for i_plugin in self.plugins:
+        for resource in self.resource_registry:
+            check_cursor_pagination(resource, self.app.config)
+
+        for hook in build_plugin_hooks(self.plugins).get('after_init_plugin', ()):
             try:
-                i_plugin.after_init_plugin(app=None, blueprint=None, additional_blueprints=None)
+                hook(app=None, blueprint=None, additional_blueprints=None)
             except PluginMethodNotImplementedError:
                 pass
 
@@ -78,17 +88,23 @@ class Api(object):
         :param str urls: the urls of the view
         :param kwargs: additional options of the route
         """
-        for i_plugin in self.plugins:
+        plugin_hooks = build_plugin_hooks(self.plugins)
+        for hook in plugin_hooks.get('before_route', ()):
             try:
-                i_plugin.before_route(resource=resource, view=view, urls=urls, self_json_api=self, **kwargs)
+                hook(resource=resource, view=view, urls=urls, self_json_api=self, **kwargs)
             except PluginMethodNotImplementedError:
                 pass
         setattr(resource, 'plugins', self.plugins)
+        setattr(resource, '_plugin_hooks', plugin_hooks)
 
         if self.qs_manager_class:
             setattr(resource, 'qs_manager_class', self.qs_manager_class)
 
         resource.view = view
+        compile_resource_plan(resource)
+        if self.app is not None:
+            check_cursor_pagination(resource, self.app.config)
+        index_schema_types()
         url_rule_options = kwargs.get('url_rule_options') or dict()
 
         if hasattr(resource, 'decorators'):
@@ -117,9 +133,9 @@ class Api(object):
 
         self.resource_registry.append(resource)
 
-        for i_plugin in self.plugins:
+        for hook in plugin_hooks.get('after_route', ()):
             try:
-                i_plugin.after_route(resource=resource, view=view, urls=urls, self_json_api=self, **kwargs)
+                hook(resource=resource, view=view, urls=urls, self_json_api=self, **kwargs)
             except PluginMethodNotImplementedError:
                 pass
 
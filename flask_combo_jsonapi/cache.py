@@ -0,0 +1,95 @@
+"""Small in-process caches used to keep request independent work out of the request cycle"""
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """Bounded, thread-safe mapping dropping the least recently used entries first"""
+
+    def __init__(self, maxsize=128):
+        """Initialize the cache
+
+        :param int maxsize: the maximum number of entries, 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """Get a value from the cache and mark it as recently used
+
+        :param key: a hashable key
+        :param default: the value returned when the key is not cached
+        :return: the cached value or default
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Put a value in the cache, dropping the least recently used entries when the cache is full
+
+        :param key: a hashable key
+        :param value: the value to cache
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def setdefault(self, key, default):
+        """Get a value from the cache, putting default in the cache first when the key is not cached.
+        Unlike get, it doesn't count as a hit or a miss.
+
+        :param key: a hashable key
+        :param default: the value cached when the key is not cached
+        :return: the cached value
+        """
+        if self.maxsize <= 0:
+            return default
+        with self._lock:
+            value = self._data.setdefault(key, default)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+
+    def resize(self, maxsize):
+        """Change the maximum number of entries
+
+        :param int maxsize: the maximum number of entries, 0 disables the cache
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        """Return the statistics of the cache
+
+        :return dict: hits, misses, current size and maximum size of the cache
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
@@ -1,38 +1,76 @@
 """This module is a CRUD interface between resource managers and the sqlalchemy ORM"""
+import json
+import re
+from time import monotonic
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session as SessionType
 
+from flask import current_app
+from sqlalchemy import and_, or_, case, distinct, false, func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.collections import InstrumentedList
 from sqlalchemy.inspection import inspect
 from sqlalchemy.orm.attributes import QueryableAttribute
 from sqlalchemy.orm import joinedload, ColumnProperty, RelationshipProperty
-from marshmallow import class_registry
-from marshmallow.base import SchemaABC
+from sqlalchemy.orm import Load, defaultload, raiseload, selectinload, subqueryload
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement, UnaryExpression
 
+from flask_combo_jsonapi.cache import LRUCache
 from flask_combo_jsonapi.data_layers.base import BaseDataLayer
+from flask_combo_jsonapi.data_layers.shared import JoinRegistry, LARGE_IN_LIST
 from flask_combo_jsonapi.data_layers.sorting.alchemy import create_sorts
 from flask_combo_jsonapi.exceptions import (
+    BadRequest,
     RelationNotFound,
     RelatedObjectNotFound,
     JsonApiException,
     ObjectNotFound,
     InvalidInclude,
     InvalidType,
+    InvalidSort,
     PluginMethodNotImplementedError,
 )
-from flask_combo_jsonapi.data_layers.filtering.alchemy import create_filters
-from flask_combo_jsonapi.schema import (
-    get_model_field,
-    get_related_schema,
-    get_relationships,
-    get_nested_fields,
-    get_schema_field,
+from flask_combo_jsonapi.data_layers.filtering.alchemy import (
+    create_filters,
+    compile_filters,
+    filters_cache,
 )
+from flask_combo_jsonapi.pagination import (
+    COUNT_MODES,
+    allows_cursor_pagination,
+    is_cursor_pagination,
+    is_paginated_relationship,
+    encode_cursor,
+    decode_cursor,
+)
+from flask_combo_jsonapi.plan import get_resource_plan
 from flask_combo_jsonapi.utils import SPLIT_REL
 
+# loader options of the loader strategies of included relationships, see flask_combo_jsonapi.plan.LOADERS
+LOADER_OPTIONS = {"joined": joinedload, "selectin": selectinload, "subquery": subqueryload}
+
+# exact collection counts by count statement, see SqlalchemyDataLayer.get_exact_collection_count
+counts_cache = LRUCache(maxsize=1024)
+
+# largest number of parameters of an IN clause by dialect, see get_max_in_parameters
+MAX_IN_PARAMETERS = {"sqlite": 999, "mssql": 2000, "oracle": 1000}
+
+# model attributes to load by plan and sparse fieldset, see get_load_only_attributes
+load_only_cache = LRUCache(maxsize=1024)
+
+# execution options marking the queries built by the data layer, see is_model_query and joins_to_many
+MODEL_QUERY_OPTION = "jsonapi_model_query"
+TO_MANY_OPTION = "jsonapi_joins_to_many"
+
+# parameters of the urls of relationships, like <person_id> or <person.person_id>
+URL_PARAMETER = re.compile(r"^<(.*)>$")
+
 
 class SqlalchemyDataLayer(BaseDataLayer):
     """Sqlalchemy data layer"""
@@ -58,6 +96,18 @@ class SqlalchemyDataLayer(BaseDataLayer):
         self.disable_collection_count: bool = False
         self.default_collection_count: int = -1
 
+    @property
+    def plan(self):
+        """The compiled plan of the resource schema"""
+        return get_resource_plan(self.resource)
+
+    @property
+    def primary_key(self):
+        """The name of the primary key of the model"""
+        if getattr(self.resource, "schema", None) is not None:
+            return self.plan.id_field
+        return inspect(self.model).primary_key[0].key
+
     def post_init(self):
         """
         Checking some props here
@@ -67,6 +117,21 @@ class SqlalchemyDataLayer(BaseDataLayer):
             # if working outside the resource, it's not assigned here
             return
 
+        if getattr(self, "count_mode", "exact") not in COUNT_MODES:
+            raise ValueError(f"Data layer's parameter `count_mode` has to be one of {', '.join(COUNT_MODES)}")
+        if getattr(self, "count_strategy", "query") not in ("query", "window"):
+            raise ValueError("Data layer's parameter `count_strategy` has to be query or window")
+        for path, loader in getattr(self, "include_loaders", {}).items():
+            if loader not in LOADER_OPTIONS:
+                raise ValueError(f"Data layer's loader of {path} has to be one of {', '.join(LOADER_OPTIONS)}")
+        if getattr(self, "pagination_strategy", "offset") not in ("offset", "deferred_join"):
+            raise ValueError("Data layer's parameter `pagination_strategy` has to be offset or deferred_join")
+        if getattr(self, "cursor_pagination", None) not in (None, True, False):
+            raise ValueError("Data layer's parameter `cursor_pagination` has to be True or False")
+        large_in_list = getattr(self, "large_in_list", LARGE_IN_LIST)
+        if not isinstance(large_in_list, int) or isinstance(large_in_list, bool) or large_in_list < 1:
+            raise ValueError("Data layer's parameter `large_in_list` has to be a positive integer")
+
         if not hasattr(self.resource, "disable_collection_count") or self.resource.disable_collection_count is False:
             return
 
@@ -93,33 +158,31 @@ class SqlalchemyDataLayer(BaseDataLayer):
         :param dict view_kwargs: kwargs from the resource view
         :return DeclarativeMeta: an object from sqlalchemy
         """
-        for i_plugins in self.resource.plugins:
+        for hook in self.resource._plugin_hooks.get("data_layer_before_create_object", ()):
             try:
-                i_plugins.data_layer_before_create_object(data=data, view_kwargs=view_kwargs, self_json_api=self)
+                hook(data=data, view_kwargs=view_kwargs, self_json_api=self)
             except PluginMethodNotImplementedError:
                 pass
 
         self.before_create_object(data, view_kwargs)
 
-        relationship_fields = get_relationships(self.resource.schema, model_field=True)
-        nested_fields = get_nested_fields(self.resource.schema, model_field=True)
+        plan = self.plan
+        join_fields = list(plan.join_fields)
 
-        join_fields = relationship_fields + nested_fields
-
-        for i_plugins in self.resource.plugins:
+        for hook in self.resource._plugin_hooks.get("data_layer_create_object_clean_data", ()):
             try:
-                data = i_plugins.data_layer_create_object_clean_data(
+                data = hook(
                     data=data, view_kwargs=view_kwargs, join_fields=join_fields, self_json_api=self,
                 )
             except PluginMethodNotImplementedError:
                 pass
-        obj = self.model(**{key: value for (key, value) in data.items() if key not in join_fields})
+        obj = self.model(**{key: value for (key, value) in data.items() if key not in plan.join_fields_set})
         self.apply_relationships(data, obj)
         self.apply_nested_fields(data, obj)
 
-        for i_plugins in self.resource.plugins:
+        for hook in self.resource._plugin_hooks.get("data_layer_after_create_object", ()):
             try:
-                i_plugins.data_layer_after_create_object(
+                hook(
                     data=data, view_kwargs=view_kwargs, obj=obj, self_json_api=self,
                 )
             except PluginMethodNotImplementedError:
@@ -150,7 +213,7 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         self.before_get_object(view_kwargs)
 
-        id_field = getattr(self, "id_field", inspect(self.model).primary_key[0].key)
+        id_field = getattr(self, "id_field", None) or self.primary_key
         try:
             filter_field = getattr(self.model, id_field)
         except Exception:
@@ -162,9 +225,9 @@ class SqlalchemyDataLayer(BaseDataLayer):
         query = self.retrieve_object_query(view_kwargs, filter_field, filter_value)
 
         if self.resource is not None:
-            for i_plugins in self.resource.plugins:
+            for hook in self.resource._plugin_hooks.get("data_layer_get_object_update_query", ()):
                 try:
-                    query = i_plugins.data_layer_get_object_update_query(
+                    query = hook(
                         query=query, qs=qs, view_kwargs=view_kwargs, self_json_api=self,
                     )
                 except PluginMethodNotImplementedError:
@@ -172,6 +235,7 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         if qs is not None:
             query = self.eagerload_includes(query, qs)
+            query = self.load_only_query(query, qs)
 
         try:
             obj = query.one()
@@ -192,7 +256,110 @@ class SqlalchemyDataLayer(BaseDataLayer):
         if self.disable_collection_count is True:
             return self.default_collection_count
 
-        return query.count()
+        count_mode = qs.pagination.get("count", getattr(self, "count_mode", "exact"))
+        if count_mode == "none":
+            return self.default_collection_count
+        if count_mode == "estimate":
+            count = self.get_estimated_collection_count(query)
+            if count is not None:
+                return count
+
+        return self.get_exact_collection_count(query)
+
+    def get_exact_collection_count(self, query):
+        """Count the objects of a query. With a count_cache_ttl in the data layer kwargs the counts are cached
+        for that many seconds, by count statement and parameters.
+
+        :param query: SQLAlchemy query
+        :return int: the number of objects
+        """
+        statement = self.count_statement(query)
+        count_cache_ttl = getattr(self, "count_cache_ttl", 0)
+        if not count_cache_ttl:
+            return self.session.scalar(statement, bind_arguments={"mapper": inspect(self.model)})
+
+        bind = self.session.get_bind(mapper=inspect(self.model))
+        compiled = statement.compile(dialect=bind.dialect)
+        try:
+            key = (str(bind.engine.url), str(compiled), tuple(sorted(compiled.params.items())))
+            hash(key)
+        except TypeError:
+            return self.session.scalar(statement, bind_arguments={"mapper": inspect(self.model)})
+
+        now = monotonic()
+        cached = counts_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        count = self.session.scalar(statement, bind_arguments={"mapper": inspect(self.model)})
+        counts_cache.set(key, (now + count_cache_ttl, count))
+        return count
+
+    def count_statement(self, query):
+        """Build the statement counting the objects of a query. The ordering, the eager loads and the columns of the
+        model are dropped, only the joins of the query are kept: rows are counted with count(*), or objects with
+        count(DISTINCT primary key) when a to-many relationship is joined. Queries that don't select the model
+        alone (columns, grouping, distinct, limit, set operations) are counted from a subquery.
+
+        :param Query query: sqlalchemy query
+        :return Select: the count statement
+        """
+        if not is_model_query(query, self.model):
+            return select(func.count()).select_from(query.subquery())
+
+        statement = query.statement.select_from(self.model).order_by(None)
+        if not joins_to_many(query):
+            return statement.with_only_columns(func.count())
+
+        primary_key = inspect(self.model).primary_key
+        if len(primary_key) == 1:
+            return statement.with_only_columns(func.count(distinct(primary_key[0])))
+        return select(func.count()).select_from(statement.with_only_columns(*primary_key).distinct().subquery())
+
+    def get_estimated_collection_count(self, query):
+        """Estimate the number of objects of a query from the statistics of the database planner: the statistics
+        of the table of the model for queries of the model without criterion (sqlite_stat1 with SQLite, pg_class
+        with PostgreSQL) and the estimate of the planner for the other queries (PostgreSQL only).
+
+        :param query: SQLAlchemy query
+        :return int: the estimated number of objects or None if the database has no statistics for it
+        """
+        table = inspect(self.model).local_table
+        connection = self.session.connection(mapper=inspect(self.model))
+        dialect = connection.dialect.name
+        whole_table = query.whereclause is None and is_model_query(query, self.model)
+
+        if dialect == "sqlite" and whole_table:
+            try:
+                stat = connection.execute(
+                    text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table ORDER BY idx IS NOT NULL"),
+                    {"table": table.name},
+                ).scalar()
+            except Exception:
+                # ANALYZE has never been run
+                return None
+            return int(stat.split()[0]) if stat else None
+
+        if dialect == "postgresql":
+            if whole_table:
+                name = f"{table.schema}.{table.name}" if table.schema else table.name
+                count = connection.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+                    {"name": name},
+                ).scalar()
+                return count if count is not None and count >= 0 else None
+
+            try:
+                # in a savepoint: a failing EXPLAIN must not abort the transaction of the session
+                with connection.begin_nested():
+                    plan = connection.execute(Explain(query.statement)).scalar()
+            except SQLAlchemyError:
+                return None
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+
+        return None
 
     def get_collection(self, qs, view_kwargs):
         """Retrieve a collection of objects through sqlalchemy
@@ -208,28 +375,75 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         query = self.query(view_kwargs)
 
-        for i_plugins in self.resource.plugins:
+        update_query_hooks = self.resource._plugin_hooks.get("data_layer_get_collection_update_query", ())
+        for hook in update_query_hooks:
             try:
-                query = i_plugins.data_layer_get_collection_update_query(
+                query = hook(
                     query=query, qs=qs, view_kwargs=view_kwargs, self_json_api=self,
                 )
             except PluginMethodNotImplementedError:
                 pass
+        if not update_query_hooks and not overrides(self, "query"):
+            query = query.execution_options(**{MODEL_QUERY_OPTION: True})
 
-        if qs.filters:
-            query = self.filter_query(query, qs.filters, self.model)
-
-        if qs.sorting:
-            query = self.sort_query(query, qs.sorting)
-
-        objects_count = self.get_collection_count(query, qs, view_kwargs)
+        # filters and sorts along the same to-one relationship share its join
+        join_registry = JoinRegistry(
+            dialect=self.session.get_bind(mapper=inspect(self.model)).dialect.name,
+            large_in_list=getattr(self, "large_in_list", LARGE_IN_LIST),
+        )
+        filters = self.get_compiled_filters(qs)
+        if filters:
+            query = self.filter_query(query, filters, self.model, join_registry=join_registry)
+            if join_registry.to_many:
+                query = query.execution_options(**{TO_MANY_OPTION: True})
+
+        cursor = is_cursor_pagination(qs.pagination)
+        if cursor and not allows_cursor_pagination(self, current_app.config):
+            parameter = next(key for key in ("cursor", "after", "before") if key in qs.pagination)
+            raise BadRequest("Cursor pagination is not available", source={"parameter": f"page[{parameter}]"})
+        count_mode = qs.pagination.get("count", getattr(self, "count_mode", "exact"))
+        if self.disable_collection_count is True:
+            count_mode = "none"
+        window_count = not cursor and getattr(self, "count_strategy", "query") == "window" and count_mode == "exact"
+        # without a count the links of the page are built from whether a row follows the page
+        has_more = not cursor and count_mode == "none" and qs.pagination.get("size") != 0
+
+        if getattr(filters, "empty", False):
+            # the filters can't match any object, the database is not queried
+            if cursor:
+                qs.page_info = {"prev": None, "next": None}
+            elif has_more:
+                qs.page_info = {"has_more": False}
+            objects_count = self.default_collection_count if count_mode == "none" else 0
+            return objects_count, self.after_get_collection([], qs, view_kwargs)
+
+        # objects are counted before sorting: the count needs neither the ordering nor the sort joins
+        if not window_count:
+            objects_count = self.get_collection_count(query, qs, view_kwargs)
+        count_query = query
+
+        keyset = None
+        if cursor:
+            query, keyset = self.keyset_sort_query(query, qs.sorting, join_registry=join_registry)
+        elif qs.sorting:
+            query = self.sort_query(query, qs.sorting, join_registry=join_registry)
+        if join_registry.to_many:
+            query = query.execution_options(**{TO_MANY_OPTION: True})
 
         if getattr(self, "eagerload_includes", True):
             query = self.eagerload_includes(query, qs)
+        query = self.load_only_query(query, qs)
+
+        if keyset is not None:
+            collection = self.keyset_paginate_query(query, keyset, qs)
+        elif window_count:
+            objects_count, collection = self.window_paginate_query(query, count_query, qs.pagination)
+        elif has_more:
+            collection = self.has_more_paginate_query(query, qs)
+        else:
+            query = self.paginate_query(query, qs.pagination)
 
-        query = self.paginate_query(query, qs.pagination)
-
-        collection = query.all()
+            collection = query.all()
 
         collection = self.after_get_collection(collection, qs, view_kwargs)
 
@@ -250,21 +464,19 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         self.before_update_object(obj, data, view_kwargs)
 
-        relationship_fields = get_relationships(self.resource.schema, model_field=True)
-        nested_fields = get_nested_fields(self.resource.schema, model_field=True)
-
-        join_fields = relationship_fields + nested_fields
+        plan = self.plan
+        join_fields = list(plan.join_fields)
 
-        for i_plugins in self.resource.plugins:
+        for hook in self.resource._plugin_hooks.get("data_layer_update_object_clean_data", ()):
             try:
-                data = i_plugins.data_layer_update_object_clean_data(
+                data = hook(
                     data=data, obj=obj, view_kwargs=view_kwargs, join_fields=join_fields, self_json_api=self,
                 )
             except PluginMethodNotImplementedError:
                 pass
 
         for key, value in data.items():
-            if hasattr(obj, key) and key not in join_fields:
+            if hasattr(obj, key) and key not in plan.join_fields_set:
                 setattr(obj, key, value)
 
         self.apply_relationships(data, obj)
@@ -298,9 +510,9 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         self.before_delete_object(obj, view_kwargs)
 
-        for i_plugins in self.resource.plugins:
+        for hook in self.resource._plugin_hooks.get("data_layer_delete_object_clean_data", ()):
             try:
-                i_plugins.data_layer_delete_object_clean_data(obj=obj, view_kwargs=view_kwargs, self_json_api=self)
+                hook(obj=obj, view_kwargs=view_kwargs, self_json_api=self)
             except PluginMethodNotImplementedError:
                 pass
 
@@ -344,12 +556,10 @@ class SqlalchemyDataLayer(BaseDataLayer):
         if isinstance(json_data["data"], list):
             obj_ids = {str(getattr(obj__, related_id_field)) for obj__ in getattr(obj, relationship_field)}
 
-            for obj_ in json_data["data"]:
-                if obj_["id"] not in obj_ids:
-                    getattr(obj, relationship_field).append(
-                        self.get_related_object(related_model, related_id_field, obj_)
-                    )
-                    updated = True
+            new_objs = [obj_ for obj_ in json_data["data"] if obj_["id"] not in obj_ids]
+            for related_object in self.get_related_objects(related_model, related_id_field, new_objs):
+                getattr(obj, relationship_field).append(related_object)
+                updated = True
         else:
             related_object = None
 
@@ -375,13 +585,18 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         return obj, updated
 
-    def get_relationship(self, relationship_field, related_type_, related_id_field, view_kwargs):
-        """Get a relationship
+    def get_relationship(self, relationship_field, related_type_, related_id_field, view_kwargs, qs=None):
+        """Get a relationship. The identifiers of the related objects are selected through the join condition of
+        the relationship, without loading the related objects, unless after_get_relationship is overridden since it
+        receives them. When the querystring gives a page size or a page number (see
+        QueryStringManager.requested_pagination), a page of the identifiers of a to-many relationship is returned and
+        qs.page_info tells whether another page follows.
 
         :param str relationship_field: the model attribute used for relationship
         :param str related_type_: the related resource type
         :param str related_id_field: the identifier field of the related model
         :param dict view_kwargs: kwargs from the resource view
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
         :return tuple: the object and related object(s)
         """
         self.before_get_relationship(relationship_field, related_type_, related_id_field, view_kwargs)
@@ -393,9 +608,28 @@ class SqlalchemyDataLayer(BaseDataLayer):
             filter_value = view_kwargs[url_field]
             raise ObjectNotFound(f"{self.model.__name__}: {filter_value} not found", source={"parameter": url_field})
 
-        if not hasattr(obj, relationship_field):
+        if not hasattr(type(obj), relationship_field):
             raise RelationNotFound(f"{obj.__class__.__name__} has no attribute {relationship_field}")
 
+        query = None
+        if not overrides(self, "after_get_relationship"):
+            query = self.related_ids_query(obj, relationship_field, related_id_field)
+        if query is not None:
+            if not getattr(self.model, relationship_field).property.uselist:
+                relationship = self.plan.relationships_by_attribute.get(relationship_field)
+                if relationship is not None and relationship.linkage_attribute is not None \
+                        and relationship.id_field == related_id_field:
+                    related_id = getattr(obj, relationship.linkage_attribute)
+                else:
+                    related_id = query.scalar()
+                return obj, None if related_id is None else {"type": related_type_, "id": related_id}
+
+            if qs is not None and is_paginated_relationship(qs):
+                related_ids = self.has_more_paginate_query(query, qs)
+            else:
+                related_ids = query.all()
+            return obj, [{"type": related_type_, "id": related_id} for related_id, in related_ids]
+
         related_objects = getattr(obj, relationship_field)
 
         if related_objects is None:
@@ -410,6 +644,25 @@ class SqlalchemyDataLayer(BaseDataLayer):
         else:
             return obj, {"type": related_type_, "id": getattr(related_objects, related_id_field)}
 
+    def related_ids_query(self, obj, relationship_field, related_id_field):
+        """Build the query selecting the identifiers of the related objects of a relationship through its join
+        condition, ordered like the relationship or by identifier
+
+        :param DeclarativeMeta obj: an object from sqlalchemy
+        :param str relationship_field: the model attribute used for relationship
+        :param str related_id_field: the identifier field of the related model
+        :return Query: the query, None if the identifier field isn't a column of the related model
+        """
+        relationship = getattr(self.model, relationship_field).property
+        if not isinstance(relationship, RelationshipProperty):
+            return None
+        related_id_column = getattr(relationship.mapper.class_, related_id_field, None)
+        if not isinstance(getattr(related_id_column, "property", None), ColumnProperty):
+            return None
+
+        query = self.session.query(related_id_column).with_parent(obj, getattr(self.model, relationship_field))
+        return query.order_by(*relationship.order_by) if relationship.order_by else query.order_by(related_id_column)
+
     def update_relationship(self, json_data, relationship_field, related_id_field, view_kwargs):
         """Update a relationship
 
@@ -436,10 +689,7 @@ class SqlalchemyDataLayer(BaseDataLayer):
         updated = False
 
         if isinstance(json_data["data"], list):
-            related_objects = []
-
-            for obj_ in json_data["data"]:
-                related_objects.append(self.get_related_object(related_model, related_id_field, obj_))
+            related_objects = self.get_related_objects(related_model, related_id_field, json_data["data"])
 
             obj_ids = {getattr(obj__, related_id_field) for obj__ in getattr(obj, relationship_field)}
             new_obj_ids = {getattr(related_object, related_id_field) for related_object in related_objects}
@@ -499,12 +749,10 @@ class SqlalchemyDataLayer(BaseDataLayer):
         if isinstance(json_data["data"], list):
             obj_ids = {str(getattr(obj__, related_id_field)) for obj__ in getattr(obj, relationship_field)}
 
-            for obj_ in json_data["data"]:
-                if obj_["id"] in obj_ids:
-                    getattr(obj, relationship_field).remove(
-                        self.get_related_object(related_model, related_id_field, obj_)
-                    )
-                    updated = True
+            removed_objs = [obj_ for obj_ in json_data["data"] if obj_["id"] in obj_ids]
+            for related_object in self.get_related_objects(related_model, related_id_field, removed_objs):
+                getattr(obj, relationship_field).remove(related_object)
+                updated = True
         else:
             setattr(obj, relationship_field, None)
             updated = True
@@ -539,6 +787,51 @@ class SqlalchemyDataLayer(BaseDataLayer):
 
         return related_object
 
+    def get_related_objects(self, related_model, related_id_field, objs):
+        """Get related objects with one IN query, chunked to the parameters limit of the database. Objects already
+        loaded in the session are taken from its identity map. Overriding get_related_object makes the objects be
+        retrieved one by one with it.
+
+        :param Model related_model: an sqlalchemy model
+        :param str related_id_field: the identifier field of the related model
+        :param list objs: the resource identifiers of the related objects
+        :return list: the related objects, in the order of the identifiers
+        """
+        if overrides(self, "get_related_object"):
+            return [self.get_related_object(related_model, related_id_field, obj) for obj in objs]
+
+        identifiers = list(dict.fromkeys(str(obj["id"]) for obj in objs))
+        found = {}
+
+        mapper = inspect(related_model)
+        primary_key = mapper.primary_key
+        if len(primary_key) == 1 and mapper.get_property_by_column(primary_key[0]).key == related_id_field:
+            python_type = get_python_type(primary_key[0])
+            for identifier in identifiers:
+                try:
+                    key = mapper.identity_key_from_primary_key([python_type(identifier)])
+                except (TypeError, ValueError):
+                    continue
+                related_object = self.session.identity_map.get(key)
+                if related_object is not None and not inspect(related_object).expired:
+                    found[identifier] = related_object
+
+        missing = [identifier for identifier in identifiers if identifier not in found]
+        if missing:
+            column = getattr(related_model, related_id_field)
+            size = get_max_in_parameters(self.session.get_bind(mapper=mapper).dialect)
+            for start in range(0, len(missing), size):
+                for related_object in self.session.query(related_model).filter(column.in_(missing[start:start + size])):
+                    found[str(getattr(related_object, related_id_field))] = related_object
+
+        not_found = [identifier for identifier in identifiers if identifier not in found]
+        if not_found:
+            raise RelatedObjectNotFound(
+                f"{related_model.__name__}.{related_id_field}: {', '.join(not_found)} not found"
+            )
+
+        return [found[str(obj["id"])] for obj in objs]
+
     def apply_relationships(self, data, obj):
         """Apply relationship provided by data to obj
 
@@ -546,36 +839,37 @@ class SqlalchemyDataLayer(BaseDataLayer):
         :param DeclarativeMeta obj: the sqlalchemy object to plug relationships to
         :return boolean: True if relationship have changed else False
         """
-        relationships_to_apply = []
-        relationship_fields = get_relationships(self.resource.schema, model_field=True)
+        # identifiers grouped by related model to retrieve the related objects with one query per model
+        identifiers = {}
+        relationships = self.plan.relationships_by_attribute
         for key, value in data.items():
-            if key in relationship_fields:
-                related_model = getattr(obj.__class__, key).property.mapper.class_
-                schema_field = get_schema_field(self.resource.schema, key)
-                related_id_field = self.resource.schema._declared_fields[schema_field].id_field
+            if key in relationships:
+                related_model = relationships[key].related_model or getattr(obj.__class__, key).property.mapper.class_
+                values = value if isinstance(value, list) else [] if value is None else [value]
+                identifiers.setdefault((related_model, relationships[key].id_field), []).extend(values)
 
-                if isinstance(value, list):
-                    related_objects = []
-
-                    for identifier in value:
-                        related_object = self.get_related_object(related_model, related_id_field, {"id": identifier})
-                        related_objects.append(related_object)
-
-                    relationships_to_apply.append({"field": key, "value": related_objects})
-                else:
-                    related_object = None
-
-                    if value is not None:
-                        related_object = self.get_related_object(related_model, related_id_field, {"id": value})
+        related_objects = {}
+        for (related_model, related_id_field), values in identifiers.items():
+            objs = [{"id": value} for value in values]
+            for value, related_object in zip(values, self.get_related_objects(related_model, related_id_field, objs)):
+                related_objects[related_model, str(value)] = related_object
 
-                    relationships_to_apply.append({"field": key, "value": related_object})
+        relationships_to_apply = []
+        for key, value in data.items():
+            if key in relationships:
+                related_model = relationships[key].related_model or getattr(obj.__class__, key).property.mapper.class_
+                if isinstance(value, list):
+                    value = [related_objects[related_model, str(identifier)] for identifier in value]
+                elif value is not None:
+                    value = related_objects[related_model, str(value)]
+                relationships_to_apply.append({"field": key, "value": value})
 
         for relationship in relationships_to_apply:
             setattr(obj, relationship["field"], relationship["value"])
 
     def apply_nested_fields(self, data, obj):
         nested_fields_to_apply = []
-        nested_fields = get_nested_fields(self.resource.schema, model_field=True)
+        nested_fields = self.plan.nested_model_fields
         for key, value in data.items():
             if key in nested_fields:
                 nested_field_inspection = inspect(getattr(obj.__class__, key))
@@ -609,32 +903,60 @@ class SqlalchemyDataLayer(BaseDataLayer):
         for nested_field in nested_fields_to_apply:
             setattr(obj, nested_field["field"], nested_field["value"])
 
-    def filter_query(self, query, filter_info, model):
+    def filter_query(self, query, filter_info, model, join_registry=None):
         """Filter query according to jsonapi 1.0
 
         :param Query query: sqlalchemy query to sort
         :param filter_info: filter information
         :type filter_info: dict or None
         :param DeclarativeMeta model: an sqlalchemy model
+        :param JoinRegistry join_registry: the aliases already joined to the query, new joins are added to it
         :return Query: the sorted query
         """
         if filter_info:
-            filters, joins = create_filters(model, filter_info, self.resource)
+            filters, joins = create_filters(model, filter_info, self.resource, join_registry)
             for i_join in joins:
                 query = query.join(*i_join)
             query = query.filter(*filters)
 
         return query
 
-    def sort_query(self, query, sort_info):
+    def get_compiled_filters(self, qs):
+        """Get the filters of the querystring compiled for the model of the data layer.
+
+        Compiled filters are cached by raw filter parameters, so parsing, validation and deserialization of
+        the values happen once for identical filters. Plugins resolving filter nodes themselves and
+        `cache_filters = False` in the data layer kwargs disable the cache.
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return: compiled filters or the filters information if they can't be cached
+        """
+        filters_key = getattr(qs, "filters_key", None)
+        if (
+            filters_key is None
+            or getattr(self, "cache_filters", True) is False
+            or "before_data_layers_filtering_alchemy_nested_resolve" in self.resource._plugin_hooks
+        ):
+            return qs.filters
+
+        key = (type(qs), self.resource.schema, self.model, filters_key)
+        compiled = filters_cache.get(key)
+        if compiled is None:
+            compiled = compile_filters(self.model, qs.filters, self.resource)
+            filters_cache.set(key, compiled)
+        return compiled
+
+    def sort_query(self, query, sort_info, join_registry=None):
         """Sort query according to jsonapi 1.0
 
         :param Query query: sqlalchemy query to sort
         :param list sort_info: sort information
+        :param JoinRegistry join_registry: the aliases already joined to the query, new joins are added to it
         :return Query: the sorted query
         """
         if sort_info:
-            sorts, joins = create_sorts(self.model, sort_info, self.resource if hasattr(self, "resource") else None)
+            resource = self.resource if hasattr(self, "resource") else None
+            sorts, joins = create_sorts(self.model, sort_info, resource, join_registry)
             for i_join in joins:
                 query = query.join(*i_join)
             for i_sort in sorts:
@@ -652,55 +974,263 @@ class SqlalchemyDataLayer(BaseDataLayer):
             return query
 
         page_size = paginate_info.get("size")
-        query = query.limit(page_size)
-        if paginate_info.get("number"):
-            query = query.offset((paginate_info["number"] - 1) * page_size)
+        return self.limit_query(query, page_size, ((paginate_info.get("number") or 1) - 1) * page_size)
+
+    def limit_query(self, query, limit, offset):
+        """Apply LIMIT and OFFSET to a query. With the "deferred_join" pagination_strategy in the data layer kwargs,
+        LIMIT and OFFSET are applied to a subquery selecting the primary keys of the objects only, which is then
+        joined to the query: the database skips narrow rows instead of wide rows (and their eager loaded
+        relationships) for deep pages. The query keeps its ORDER BY clause, so the order of the page is preserved.
+        Queries joining a to-many relationship may return an object on several rows and are limited directly, so
+        that their pages are the same as with the "offset" strategy.
+
+        :param Query query: sqlalchemy query
+        :param int limit: the maximum number of objects
+        :param int offset: the number of objects to skip
+        :return Query: the limited query
+        """
+        if getattr(self, "pagination_strategy", "offset") != "deferred_join" or not is_model_query(query, self.model) \
+                or joins_to_many(query):
+            query = query.limit(limit)
+            return query.offset(offset) if offset else query
+
+        primary_key = inspect(self.model).primary_key
+        keys = query.with_entities(*primary_key).limit(limit)
+        if offset:
+            keys = keys.offset(offset)
+        keys = keys.subquery()
+        return query.join(keys, and_(*(column == keys.c[column.key] for column in primary_key)))
+
+    def has_more_paginate_query(self, query, qs):
+        """Retrieve a page without counting the objects of the collection: one more row than the size of the page
+        is fetched and dropped, its presence being stored in qs.page_info to build the pagination links.
+
+        :param Query query: sqlalchemy query
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return list: the objects of the page
+        """
+        page_size = qs.pagination.get("size")
+        offset = ((qs.pagination.get("number") or 1) - 1) * page_size
+        collection = self.limit_query(query, page_size + 1, offset).all()
+        qs.page_info = {"has_more": len(collection) > page_size}
+        return collection[:page_size]
+
+    def window_paginate_query(self, query, count_query, paginate_info):
+        """Retrieve a page and the number of objects of the collection in a single query, the number of objects
+        being read from a count(*) OVER () column of the page. The objects are counted by a separate query
+        when a page after the first one is empty, and when the query joins a to-many relationship: the window
+        would count the joined rows instead of the objects.
+
+        :param Query query: sqlalchemy query
+        :param Query count_query: the query to count the objects with, without eager loading
+        :param dict paginate_info: pagination information
+        :return tuple: the number of objects and the objects of the page
+        """
+        if joins_to_many(query):
+            return self.get_exact_collection_count(count_query), self.paginate_query(query, paginate_info).all()
 
-        return query
+        if paginate_info.get("size") == 0:
+            collection = query.all()
+            return len(collection), collection
+
+        rows = self.paginate_query(query.add_columns(func.count().over()), paginate_info).all()
+        if rows:
+            return rows[0][-1], [row[0] for row in rows]
+        if (paginate_info.get("number") or 1) > 1:
+            return self.get_exact_collection_count(count_query), []
+        return 0, []
+
+    def keyset_sort_query(self, query, sort_info, join_registry=None):
+        """Join the relationships to sort on and compute the keyset of the cursor pagination: the sort fields
+        followed by the primary key as tiebreaker
+
+        :param Query query: sqlalchemy query to sort
+        :param list sort_info: sort information
+        :param JoinRegistry join_registry: the aliases already joined to the query, new joins are added to it
+        :return tuple: the query and the keyset, a list of (column, descending, nullable) tuples
+        """
+        keyset = []
+        if sort_info:
+            resource = self.resource if hasattr(self, "resource") else None
+            sorts, joins = create_sorts(self.model, sort_info, resource, join_registry)
+            for i_join in joins:
+                query = query.join(*i_join)
+            for i_sort in sorts:
+                if not isinstance(i_sort, UnaryExpression) \
+                        or i_sort.modifier not in (operators.asc_op, operators.desc_op):
+                    raise InvalidSort("You can't use a cursor with a custom sort")
+                column = i_sort.element
+                keyset.append((column, i_sort.modifier is operators.desc_op, getattr(column, "nullable", True)))
+
+        mapper = inspect(self.model)
+        for column in mapper.primary_key:
+            column = getattr(self.model, mapper.get_property_by_column(column).key)
+            if not any(column.compare(sort_column) for sort_column, _, _ in keyset):
+                keyset.append((column, False, False))
+
+        return query, keyset
+
+    def keyset_paginate_query(self, query, keyset, qs):
+        """Retrieve a page of the cursor pagination. The cursors of the previous and next pages are stored in
+        the page_info of the querystring manager.
+
+        Null values are sorted after the other values in ascending order, whatever the database.
+
+        :param Query query: sqlalchemy query
+        :param list keyset: the sort columns as computed by keyset_sort_query
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return list: the objects of the page
+        """
+        pagination = qs.pagination
+        page_size = pagination["size"]
+        sort = qs.qs.get("sort", "")
+        backward = "before" in pagination
+        parameter = next(key for key in ("before", "after", "cursor") if key in pagination)
+
+        if pagination[parameter]:
+            values = decode_cursor(pagination[parameter], sort, len(keyset), f"page[{parameter}]")
+            conditions = []
+            for index, (column, descending, _) in enumerate(keyset):
+                equals = [keyset_equal(keyset[i][0], values[i]) for i in range(index)]
+                if descending is backward:
+                    conditions.append(and_(*equals, keyset_greater(column, values[index])))
+                else:
+                    conditions.append(and_(*equals, keyset_lower(column, values[index])))
+            query = query.filter(or_(*conditions))
+
+        order_by = []
+        for column, descending, nullable in keyset:
+            ascending = descending is backward
+            if nullable:
+                is_null = case((column.is_(None), 1), else_=0)
+                order_by.append(is_null.asc() if ascending else is_null.desc())
+            order_by.append(column.asc() if ascending else column.desc())
+        query = query.order_by(*order_by)
+
+        rows = query.add_columns(*(column for column, _, _ in keyset)).limit(page_size + 1).all()
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backward:
+            rows.reverse()
+
+        page_info = {"prev": None, "next": None}
+        if rows:
+            first, last = encode_cursor(list(rows[0][1:]), sort), encode_cursor(list(rows[-1][1:]), sort)
+            if backward:
+                page_info.update(prev=first if has_more else None, next=last)
+            else:
+                page_info.update(prev=first if pagination[parameter] else None, next=last if has_more else None)
+        qs.page_info = page_info
+
+        return [row[0] for row in rows]
 
     def eagerload_includes(self, query, qs):
         """Use eagerload feature of sqlalchemy to optimize data retrieval for include querystring parameter
 
         :param Query query: sqlalchemy queryset
         :param QueryStringManager qs: a querystring manager to retrieve information from url
+        Each relationship is loaded with its own loader strategy: the one given for its include path in the
+        include_loaders data layer kwarg, otherwise the loader of the relationship plan. With strict_loading in the
+        data layer kwargs, the relationship fields that are not included raise instead of being lazy loaded.
+
         :return Query: the query with includes eagerloaded
         """
+        include_loaders = getattr(self, "include_loaders", {})
         for include in qs.include:
-            joinload_object = None
-
-            if SPLIT_REL in include:
-                current_schema = self.resource.schema
-                for obj in include.split(SPLIT_REL):
-                    try:
-                        field = get_model_field(current_schema, obj)
-                    except Exception as e:
-                        raise InvalidInclude(str(e))
-
-                    if joinload_object is None:
-                        joinload_object = joinedload(field)
-                    else:
-                        joinload_object = joinload_object.joinedload(field)
+            load_object = None
+
+            current_plan = self.plan
+            path = []
+            for obj in include.split(SPLIT_REL):
+                relationship = current_plan.relationships.get(obj)
+                if relationship is None:
+                    if obj not in current_plan.schema_to_model:
+                        raise InvalidInclude(f"{current_plan.schema.__name__} has no attribute {obj}")
+                    raise InvalidInclude(f"{obj} is not a relationship attribute of {current_plan.schema.__name__}")
+
+                path.append(obj)
+                loader = include_loaders.get(SPLIT_REL.join(path), relationship.loader)
+                if load_object is None:
+                    load_object = LOADER_OPTIONS[loader](relationship.attribute)
+                else:
+                    load_object = getattr(load_object, LOADER_OPTIONS[loader].__name__)(relationship.attribute)
 
-                    related_schema_cls = get_related_schema(current_schema, obj)
+                current_plan = relationship.related_plan
 
-                    if isinstance(related_schema_cls, SchemaABC):
-                        related_schema_cls = related_schema_cls.__class__
-                    else:
-                        related_schema_cls = class_registry.get_class(related_schema_cls)
+            query = query.options(load_object)
 
-                    current_schema = related_schema_cls
-            else:
-                try:
-                    field = get_model_field(self.resource.schema, include)
-                except Exception as e:
-                    raise InvalidInclude(str(e))
+        if getattr(self, "strict_loading", False):
+            query = query.options(*self.strict_loading_options(self.plan, qs.include))
+
+        return query
 
-                joinload_object = joinedload(field)
+    def load_only_query(self, query, qs):
+        """Load only the columns of the sparse fieldsets (fields querystring parameter) of the primary type and of
+        the included types. Primary and foreign keys, the columns read by the links of the requested relationships
+        and the model attributes listed in the "depends_on" metadata of the requested fields are always loaded.
+        Types with a requested field that isn't backed by a model attribute nor declares its dependencies load
+        every column. Set load_only_fields to False in the data layer kwargs to load every column.
 
-            query = query.options(joinload_object)
+        :param Query query: sqlalchemy query
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return Query: the query loading only the columns of the sparse fieldsets
+        """
+        fields = qs.fields
+        if not fields or getattr(self, "load_only_fields", True) is False:
+            return query
+
+        attributes = get_load_only_attributes(self.plan, fields.get(self.plan.schema.opts.type_))
+        if attributes is not None:
+            query = query.options(Load(self.model).load_only(*attributes))
+
+        for include in qs.include:
+            option = None
+            current_plan = self.plan
+            for obj in include.split(SPLIT_REL):
+                relationship = current_plan.relationships.get(obj)
+                if relationship is None:
+                    break
+                option = defaultload(relationship.attribute) if option is None \
+                    else option.defaultload(relationship.attribute)
+                current_plan = relationship.related_plan
+            else:
+                attributes = get_load_only_attributes(current_plan, fields.get(current_plan.schema.opts.type_))
+                if attributes is not None:
+                    query = query.options(option.load_only(*attributes))
 
         return query
 
+    def strict_loading_options(self, plan, includes, path=()):
+        """Build the raiseload options of the relationship fields of a schema that are not included and don't
+        render their resource linkage, so that dumping the schema never lazy loads a relationship
+
+        :param ResourcePlan plan: the plan of the schema
+        :param list includes: the include paths relative to the schema
+        :param tuple path: the relationship attributes leading to the schema
+        :return list: the loader options
+        """
+        included = {}
+        for include in includes:
+            name, _, sub_include = include.partition(SPLIT_REL)
+            sub_includes = included.setdefault(name, [])
+            if sub_include:
+                sub_includes.append(sub_include)
+
+        options = []
+        for name, relationship in plan.relationships.items():
+            if name in included:
+                options.extend(self.strict_loading_options(
+                    relationship.related_plan, included[name], path + (relationship.attribute,)
+                ))
+            elif not relationship.field.include_resource_linkage:
+                option = None
+                for attribute in path:
+                    option = defaultload(attribute) if option is None else option.defaultload(attribute)
+                options.append(raiseload(relationship.attribute) if option is None
+                               else option.raiseload(relationship.attribute))
+        return options
+
     def retrieve_object_query(self, view_kwargs, filter_field, filter_value):
         """Build query to retrieve object
 
@@ -896,3 +1426,142 @@ class SqlalchemyDataLayer(BaseDataLayer):
         :param dict view_kwargs: kwargs from the resource view
         """
         pass
+
+
+def overrides(data_layer, name):
+    """Whether a method of a data layer is overridden, by a subclass or by the methods of the data layer kwargs
+
+    :param SqlalchemyDataLayer data_layer: the data layer
+    :param str name: the name of the method
+    :return bool: whether the method isn't the one of SqlalchemyDataLayer
+    """
+    method = getattr(data_layer, name)
+    return getattr(method, "__func__", method) is not getattr(SqlalchemyDataLayer, name)
+
+
+def keyset_equal(column, value):
+    """Condition of a keyset column equal to a value of a cursor"""
+    return column.is_(None) if value is None else column == value
+
+
+def keyset_greater(column, value):
+    """Condition of a keyset column after a value of a cursor, null values being the greatest ones"""
+    if value is None:
+        return false()
+    return or_(column > value, column.is_(None))
+
+
+def keyset_lower(column, value):
+    """Condition of a keyset column before a value of a cursor, null values being the greatest ones"""
+    if value is None:
+        return column.isnot(None)
+    return column < value
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, compiled and executed with the parameters of the statement"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kwargs):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kwargs)
+
+
+def is_model_query(query, model):
+    """Whether a query selects the objects of a model alone and is built by the data layer from its default query,
+    so that its only criteria, joins and ordering are those of the filters and sorts. Queries from an overridden
+    query method or changed by plugins may group, limit or join anything and aren't model queries.
+    """
+    descriptions = query.column_descriptions
+    if len(descriptions) != 1 or descriptions[0]["expr"] is not model:
+        return False
+    return query.get_execution_options().get(MODEL_QUERY_OPTION, False)
+
+
+def joins_to_many(query):
+    """Whether the filters or sorts of a model query join a to-many relationship"""
+    return query.get_execution_options().get(TO_MANY_OPTION, False)
+
+
+def get_load_only_attributes(plan, fields):
+    """Get the model attributes to load for a sparse fieldset
+
+    :param ResourcePlan plan: the plan of the schema and model
+    :param list fields: the fields of the sparse fieldset, None without sparse fieldset
+    :return tuple: the names of the model attributes, None to load every column
+    """
+    if fields is None or plan.model is None:
+        return None
+
+    key = (plan, tuple(fields))
+    attributes = load_only_cache.get(key, False)
+    if attributes is False:
+        attributes = compute_load_only_attributes(plan, fields)
+        load_only_cache.set(key, attributes)
+    return attributes
+
+
+def compute_load_only_attributes(plan, fields):
+    """Compute the model attributes to load for a sparse fieldset, see get_load_only_attributes"""
+    mapper = inspect(plan.model)
+    attributes = {
+        prop.key for prop in mapper.column_attrs
+        if any(getattr(column, "primary_key", False) or getattr(column, "foreign_keys", None)
+               for column in prop.columns)
+    }
+
+    def add_attribute(name):
+        prop = mapper.attrs.get(name)
+        if isinstance(prop, ColumnProperty):
+            attributes.add(name)
+        elif isinstance(prop, RelationshipProperty):
+            for column in prop.local_columns:
+                try:
+                    attributes.add(mapper.get_property_by_column(column).key)
+                except Exception:
+                    return False
+        else:
+            return False
+        return True
+
+    for name in set(fields) | {"id"}:
+        field = plan.schema._declared_fields.get(name)
+        if field is None:
+            continue
+        depends_on = field.metadata.get("depends_on")
+        if depends_on is not None:
+            attributes.update(depends_on)
+            continue
+        if not add_attribute(plan.schema_to_model[name]):
+            return None
+        if name in plan.relationships:
+            for url_kwargs in (getattr(field, "self_view_kwargs", None), getattr(field, "related_view_kwargs", None),
+                               field.self_url_kwargs, field.related_url_kwargs):
+                for value in (url_kwargs or {}).values():
+                    match = URL_PARAMETER.match(value) if isinstance(value, str) else None
+                    if match and not add_attribute(match.group(1).split(".")[0]):
+                        return None
+
+    return tuple(sorted(attributes))
+
+
+def get_max_in_parameters(dialect):
+    """Get the largest number of values bound to an IN clause in a statement of a dialect
+
+    :param Dialect dialect: an sqlalchemy dialect
+    :return int: the number of values
+    """
+    return MAX_IN_PARAMETERS.get(dialect.name, 10000)
+
+
+def get_python_type(column):
+    """Get the python type of the values of a column, str when it is unknown"""
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return str
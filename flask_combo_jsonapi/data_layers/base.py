@@ -63,7 +63,19 @@ class BaseDataLayer:
         At this moment self.resource is already defined
         and the layer can do any post init stuff here
 
-        NOTE that the data layer is inited for each request
+        NOTE that the data layer is inited once, when the resource class is created.
+        Use `init_request` for the work that really has to be done for each request
+        :return:
+        """
+
+    def init_request(self, resource):
+        """
+        Per request init stage.
+
+        Called before each request is dispatched to the resource method.
+        The data layer instance is shared between requests (and threads),
+        so keep any request related state out of `self`
+        :param Resource resource: the resource instance handling the request
         :return:
         """
 
@@ -122,13 +134,14 @@ class BaseDataLayer:
         """
         raise NotImplementedError
 
-    def get_relationship(self, relationship_field, related_type_, related_id_field, view_kwargs):
+    def get_relationship(self, relationship_field, related_type_, related_id_field, view_kwargs, qs=None):
         """Get information about a relationship
 
         :param str relationship_field: the model attribute used for relationship
         :param str related_type_: the related resource type
         :param str related_id_field: the identifier field of the related model
         :param dict view_kwargs: kwargs from the resource view
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
         :return tuple: the object and related object(s)
         """
         raise NotImplementedError
@@ -1,14 +1,22 @@
 """Helper to create sqlalchemy filters according to filter querystring parameter"""
+import json
 from typing import Any, List, Tuple
 
 from marshmallow_jsonapi.fields import Relationship
-from sqlalchemy import and_, or_, not_, sql
+from sqlalchemy import ARRAY, and_, or_, not_, sql, all_, any_, bindparam, func, select, true, false
 from sqlalchemy.orm import aliased
 
-from flask_combo_jsonapi.data_layers.shared import deserialize_field, create_filters_or_sorts
+from flask_combo_jsonapi.cache import LRUCache
+from flask_combo_jsonapi.data_layers.shared import (
+    deserialize_field,
+    deserialize_values,
+    create_filters_or_sorts,
+    JoinRegistry,
+)
 from flask_combo_jsonapi.exceptions import InvalidFilters, PluginMethodNotImplementedError
+from flask_combo_jsonapi.plan import get_plan
 from flask_combo_jsonapi.schema import get_relationships, get_model_field
-from flask_combo_jsonapi.utils import SPLIT_REL
+from flask_combo_jsonapi.utils import SPLIT_REL, cached_property
 
 Filter = sql.elements.BinaryExpression
 Join = List[Any]
@@ -18,32 +26,323 @@ FilterAndJoins = Tuple[
     List[Join],
 ]
 
+# compiled filter trees by (querystring manager class, schema, model, raw filter parameters)
+filters_cache = LRUCache(maxsize=1024)
 
-def create_filters(model, filter_info, resource):
+# ways to filter on the related objects of a to-many relationship, chosen with the "filter_strategy" of the metadata
+# of the relationship field: a correlated EXISTS subquery (default) or a join of the related table
+FILTER_STRATEGIES = ('exists', 'join')
+
+
+# column methods of the in / notin operators
+IN_OPERATORS = ('in_', 'notin_', 'not_in')
+
+
+def create_filters(model, filter_info, resource, join_registry=None):
     """Apply filters from filters information to base query
 
     :param DeclarativeMeta model: the model of the node
-    :param dict filter_info: current node filter information
+    :param filter_info: current node filter information or filters compiled with compile_filters
     :param Resource resource: the resource
+    :param JoinRegistry join_registry: the aliases already joined to the query
     """
-    return create_filters_or_sorts(model, filter_info, resource, Node)
+    if isinstance(filter_info, CompiledFilters):
+        return filter_info.bind(model, join_registry)
+    return create_filters_or_sorts(model, filter_info, resource, Node, join_registry)
+
+
+def compile_filters(model, filter_info, resource):
+    """Validate filters information and compile it into filter trees that can be cached
+    and bound to the query of any request
+
+    :param DeclarativeMeta model: the model of the resource
+    :param list filter_info: filters information
+    :param Resource resource: the resource
+    :return CompiledFilters: the compiled filters
+    """
+    schema = getattr(resource, 'schema') if resource else None
+    trees = [Node(model, filter_, resource, schema).compile() for filter_ in filter_info]
+    # the filters of the list are combined with and: they are simplified as a whole
+    tree = BooleanFilter('and', trees).simplify()
+    if isinstance(tree, BooleanFilter) and tree.type_filter == 'and':
+        trees = tree.trees
+    elif isinstance(tree, ConstantFilter) and tree.value:
+        trees = []
+    else:
+        trees = [tree]
+    return CompiledFilters(filter_info, trees)
+
+
+class CompiledFilters(tuple):
+    """Filters information along with its compiled filter trees"""
+
+    def __new__(cls, filter_info, trees):
+        compiled = super().__new__(cls, filter_info)
+        compiled.trees = tuple(trees)
+        return compiled
+
+    @property
+    def empty(self):
+        """Whether the filters can't match any object, whatever the data"""
+        return any(isinstance(tree, ConstantFilter) and not tree.value for tree in self.trees)
+
+    def bind(self, model, join_registry=None) -> Tuple[List[Filter], List[Join]]:
+        """Bind the filter trees to a model
+
+        :param DeclarativeMeta model: the model to filter
+        :param JoinRegistry join_registry: the aliases already joined to the query
+        :return: the filters and the joins they need
+        """
+        if join_registry is None:
+            join_registry = JoinRegistry()
+        filters = []
+        joins = []
+        for tree in self.trees:
+            filter_, tree_joins = tree.bind(model, join_registry)
+            filters.append(filter_)
+            joins.extend(tree_joins)
+        return filters, joins
+
+
+class FilterCondition(object):
+    """Compiled leaf of a filter tree: a condition on a column of the model"""
+
+    def __init__(self, attribute, marshmallow_field, op, operator=None, value=None, value_field=None,
+                 sql_filter=None, operators=None):
+        """Initialize a compiled condition
+
+        :param str attribute: the model attribute to filter on
+        :param marshmallow_field: the marshmallow field of the attribute
+        :param str op: the operator from filters information
+        :param str operator: the name of the column method implementing the operator
+        :param value: the deserialized value (the raw one when sql_filter is set)
+        :param str value_field: the model attribute to compare with instead of a value
+        :param callable sql_filter: custom filtering method of the marshmallow field
+        :param FieldOperators operators: the operators of the field, with the methods bound to its column
+        """
+        self.operators = operators
+        self.attribute = attribute
+        self.marshmallow_field = marshmallow_field
+        self.op = op
+        self.operator = operator
+        self.value = value
+        self.value_field = value_field
+        self.sql_filter = sql_filter
+
+    def bind(self, model, join_registry=None) -> FilterAndJoins:
+        """Create the sqlalchemy filter of the condition for a model"""
+        column = getattr(model, self.attribute)
+        value = self.value if self.value_field is None else getattr(model, self.value_field)
+        if self.sql_filter is not None:
+            return self.sql_filter(
+                marshmallow_field=self.marshmallow_field,
+                model_column=column,
+                value=value,
+                operator=self.op,
+            ), []
+        method = self.operators.method(self.operator, column) if self.operators is not None else None
+        return filter_operator(column, self.operator, value, join_registry, method), []
+
+    @property
+    def key(self):
+        """Structure of the condition, equal for identical conditions"""
+        return ('condition', self.attribute, self.op, self.operator, self.value_field, self.sql_filter,
+                freeze(self.value))
+
+    def simplify(self):
+        """An in list without values matches nothing, a notin list without values matches everything"""
+        if self.sql_filter is None and self.value_field is None and self.operator in IN_OPERATORS \
+                and isinstance(self.value, list) and not self.value:
+            return ConstantFilter(self.operator != 'in_')
+        return self
+
+
+class ConstantFilter(object):
+    """Compiled node of a filter tree matching every object or no object"""
+
+    def __init__(self, value):
+        """Initialize a constant filter
+
+        :param bool value: True to match every object, False to match none
+        """
+        self.value = value
+
+    def bind(self, model, join_registry=None) -> FilterAndJoins:
+        """Create the true or false constant"""
+        return (true() if self.value else false()), []
+
+    @property
+    def key(self):
+        """Structure of the constant, equal for identical constants"""
+        return ('constant', self.value)
+
+    def simplify(self):
+        return self
+
+
+class RelationshipFilter(object):
+    """Compiled node of a filter tree applying a filter tree to a related model"""
+
+    def __init__(self, attribute, related_model, tree, filter_strategy='exists', many=True):
+        """Initialize a compiled relationship filter
+
+        :param str attribute: the relationship attribute of the model
+        :param DeclarativeMeta related_model: the related model
+        :param tree: the compiled filter tree of the related model
+        :param str filter_strategy: how to filter a to-many relationship, see FILTER_STRATEGIES
+        :param bool many: whether the relationship is a to-many relationship
+        """
+        self.attribute = attribute
+        self.related_model = related_model
+        self.tree = tree
+        self.filter_strategy = filter_strategy
+        self.many = many
+
+    def bind(self, model, join_registry=None) -> FilterAndJoins:
+        """Join an alias of the related model, unless the registry already has one, and create the filter of the
+        related tree. To-many relationships are filtered with an EXISTS subquery instead."""
+        if join_registry is None:
+            join_registry = JoinRegistry()
+        relationship = getattr(model, self.attribute)
+        if use_exists(relationship, self.filter_strategy, join_registry):
+            alias = aliased(self.related_model)
+            filter_, _ = self.tree.bind(alias, join_registry.subquery_registry())
+            return related_exists(relationship, alias, filter_), []
+
+        alias, joins = join_registry.join(relationship)
+        filter_, tree_joins = self.tree.bind(alias, join_registry)
+        joins.extend(tree_joins)
+        return filter_, joins
+
+    @property
+    def key(self):
+        """Structure of the relationship filter, equal for identical filters"""
+        return ('relationship', self.attribute, self.filter_strategy, self.tree.key)
+
+    def simplify(self):
+        """Simplify the related tree. With an EXISTS subquery no object matches when no related object can. A
+        joined relationship is kept: the join excludes the objects without related object, inside a not or an or
+        too, so its filter can't be replaced by a constant.
+        """
+        tree = self.tree.simplify()
+        if isinstance(tree, ConstantFilter) and not tree.value and self.many and self.filter_strategy == 'exists':
+            return tree
+        return RelationshipFilter(self.attribute, self.related_model, tree, self.filter_strategy, self.many)
+
+    def mergeable(self, type_filter):
+        """Whether the filters on this relationship combined with and / or can be merged into one filter of the
+        related objects: always for a to-one relationship, only with or for an EXISTS subquery, as
+        EXISTS (a) AND EXISTS (b) doesn't mean that a single related object matches a and b
+        """
+        return not self.many or (type_filter == 'or' and self.filter_strategy == 'exists')
+
+
+class BooleanFilter(object):
+    """Compiled node of a filter tree combining filter trees with and / or / not"""
+
+    def __init__(self, type_filter, trees):
+        """Initialize a compiled boolean filter
+
+        :param str type_filter: 'and', 'or' or 'not'
+        :param list trees: the compiled filter trees to combine (exactly one for 'not')
+        """
+        self.type_filter = type_filter
+        self.trees = tuple(trees)
+
+    def bind(self, model, join_registry=None) -> FilterAndJoins:
+        """Combine the filters of the trees"""
+        filters = []
+        joins = []
+        for tree in self.trees:
+            filter_, tree_joins = tree.bind(model, join_registry)
+            filters.append(filter_)
+            joins.extend(tree_joins)
+        if self.type_filter == 'not':
+            return not_(filters[0]), joins
+        op = and_ if self.type_filter == 'and' else or_
+        return op(*filters), joins
+
+    @property
+    def key(self):
+        """Structure of the boolean filter, equal for identical filters"""
+        return (self.type_filter,) + tuple(tree.key for tree in self.trees)
+
+    def simplify(self):
+        """Simplify the tree: double negations and constants are removed, nested and / or of the same type are
+        flattened, duplicate filters dropped and the filters on the same relationship merged into one
+        """
+        if self.type_filter == 'not':
+            tree = self.trees[0].simplify()
+            if isinstance(tree, ConstantFilter):
+                return ConstantFilter(not tree.value)
+            if isinstance(tree, BooleanFilter) and tree.type_filter == 'not':
+                return tree.trees[0]
+            return BooleanFilter('not', [tree])
+
+        # value of the constant deciding the result alone, true for or and false for and
+        absorbing = self.type_filter == 'or'
+        trees = {}
+        relationships = {}
+        for tree in self.trees:
+            tree = tree.simplify()
+            children = tree.trees if isinstance(tree, BooleanFilter) and tree.type_filter == self.type_filter \
+                else (tree,)
+            for child in children:
+                if isinstance(child, ConstantFilter):
+                    if child.value is absorbing:
+                        return child
+                    continue
+                if not absorbing and matches_nothing(child):
+                    return ConstantFilter(False)
+                if isinstance(child, RelationshipFilter) and child.mergeable(self.type_filter):
+                    key = ('merged', child.attribute, child.filter_strategy)
+                    relationships.setdefault(key, []).append(child)
+                    # the merged filter takes the place of the first filter on the relationship
+                    trees.setdefault(key, None)
+                    continue
+                trees.setdefault(child.key, child)
+
+        for key, filters in relationships.items():
+            if len(filters) == 1:
+                merged = filters[0]
+            else:
+                tree = BooleanFilter(self.type_filter, [filter_.tree for filter_ in filters])
+                merged = RelationshipFilter(filters[0].attribute, filters[0].related_model, tree,
+                                            filters[0].filter_strategy, filters[0].many).simplify()
+            if not absorbing and matches_nothing(merged):
+                return ConstantFilter(False)
+            if isinstance(merged, ConstantFilter):
+                if merged.value is absorbing:
+                    return merged
+                del trees[key]
+            else:
+                trees[key] = merged
+
+        trees = list(trees.values())
+        if not trees:
+            return ConstantFilter(not absorbing)
+        if len(trees) == 1:
+            return trees[0]
+        return BooleanFilter(self.type_filter, trees)
 
 
 class Node(object):
     """Helper to recursively create filters with sqlalchemy according to filter querystring parameter"""
 
-    def __init__(self, model, filter_, resource, schema):
+    def __init__(self, model, filter_, resource, schema, join_registry=None):
         """Initialize an instance of a filter node
 
         :param Model model: an sqlalchemy model
         :param dict filter_: filters information of the current node and deeper nodes
         :param Resource resource: the base resource to apply filters on
         :param Schema schema: the serializer of the resource
+        :param JoinRegistry join_registry: the aliases already joined to the query
         """
         self.model = model
         self.filter_ = filter_
         self.resource = resource
         self.schema = schema
+        self.join_registry = join_registry if join_registry is not None else JoinRegistry()
 
     def create_filter(self, marshmallow_field, model_column, operator, value):
         """
@@ -64,11 +363,11 @@ class Node(object):
         * value - filtering value
         * operator - your operator, for example: "eq", "in", "ilike_str_array", ...
         """
-        try:
-            f = getattr(marshmallow_field, f'_{operator}_sql_filter_')
-        except AttributeError:
-            pass
+        if marshmallow_field is self.operators.marshmallow_field:
+            f = self.operators.sql_filters.get(operator)
         else:
+            f = getattr(marshmallow_field, f'_{operator}_sql_filter_', None)
+        if f is not None:
             return f(
                 marshmallow_field=marshmallow_field,
                 model_column=model_column,
@@ -77,19 +376,22 @@ class Node(object):
             )
         # Here we have to deserialize and validate fields, that are used in filtering,
         # so the Enum fields are loaded correctly
-        value = deserialize_field(marshmallow_field, value)
-        return getattr(model_column, self.operator)(value)
+        if self.operator in IN_OPERATORS and isinstance(value, list):
+            value = deserialize_values(marshmallow_field, value)
+        else:
+            value = deserialize_field(marshmallow_field, value)
+        return filter_operator(model_column, self.operator, value, self.join_registry,
+                               self.operators.method(self.operator, model_column))
 
     def resolve(self) -> FilterAndJoins:
         """Create filter for a particular node of the filter tree"""
-        if self.resource and hasattr(self.resource, 'plugins'):
-            for i_plugin in self.resource.plugins:
-                try:
-                    res = i_plugin.before_data_layers_filtering_alchemy_nested_resolve(self)
-                    if res is not None:
-                        return res
-                except PluginMethodNotImplementedError:
-                    pass
+        for hook in getattr(self.resource, '_plugin_hooks', {}).get('before_data_layers_filtering_alchemy_nested_resolve', ()):
+            try:
+                res = hook(self)
+                if res is not None:
+                    return res
+            except PluginMethodNotImplementedError:
+                pass
 
         if all(map(
                 lambda op: op not in self.filter_,
@@ -129,13 +431,91 @@ class Node(object):
         if 'and' in self.filter_:
             return self._create_filters(type_filter='and')
         if 'not' in self.filter_:
-            filter, joins = Node(self.model, self.filter_['not'], self.resource, self.schema).resolve()
+            filter, joins = Node(self.model, self.filter_['not'], self.resource, self.schema,
+                                 self.join_registry).resolve()
             return not_(filter), joins
 
+    def compile(self):
+        """Validate the node and compile it into a filter tree that doesn't depend on the request:
+        operators are resolved and values are deserialized once
+
+        :return: the compiled filter tree
+        """
+        if all(map(
+                lambda op: op not in self.filter_,
+                ('or', 'and', 'not'),
+        )):
+            value = self.value
+
+            if isinstance(value, dict):
+                return self._compile_relationship(value)
+
+            if SPLIT_REL in self.filter_.get('name', ''):
+                value = {
+                    'name': SPLIT_REL.join(self.filter_['name'].split(SPLIT_REL)[1:]),
+                    'op': self.filter_['op'],
+                    'val': value,
+                }
+                return self._compile_relationship(value)
+
+            marshmallow_field = self.schema._declared_fields[self.name]
+            if isinstance(marshmallow_field, Relationship):
+                value = {
+                    'name': marshmallow_field.id_field,
+                    'op': self.filter_['op'],
+                    'val': value,
+                }
+                return self._compile_relationship(value)
+
+            return self._compile_condition(marshmallow_field, value)
+
+        for type_filter in ('or', 'and'):
+            if type_filter in self.filter_:
+                return BooleanFilter(type_filter, [
+                    Node(self.model, filter_, self.resource, self.schema).compile()
+                    for filter_ in self.filter_[type_filter]
+                ])
+        return BooleanFilter('not', [Node(self.model, self.filter_['not'], self.resource, self.schema).compile()])
+
+    def _compile_condition(self, marshmallow_field, value):
+        operator = self.filter_['op']
+        attribute = get_model_field(self.schema, self.name)
+        value_field = self.filter_.get('field')
+        # make sure the column exists
+        self.column
+
+        sql_filter = self.operators.sql_filters.get(operator)
+        if sql_filter is not None:
+            if value_field is not None:
+                value = None
+            return FilterCondition(attribute, marshmallow_field, operator, value=value, value_field=value_field,
+                                   sql_filter=sql_filter)
+
+        if value_field is not None:
+            value = None
+        elif self.operator in IN_OPERATORS and isinstance(value, list):
+            value = deserialize_values(marshmallow_field, value)
+        else:
+            value = deserialize_field(marshmallow_field, value)
+        return FilterCondition(attribute, marshmallow_field, operator, operator=self.operator, value=value,
+                               value_field=value_field, operators=self.operators)
+
+    def _compile_relationship(self, value):
+        node = Node(self.related_model, value, self.resource, self.related_schema)
+        return RelationshipFilter(get_model_field(self.schema, self.name), self.related_model, node.compile(),
+                                  self.filter_strategy, self.column.property.uselist)
+
     def _relationship_filtering(self, value):
-        alias = aliased(self.related_model)
-        joins = [[alias, self.column]]
-        node = Node(alias, value, self.resource, self.related_schema)
+        # validate the relationship before joining it
+        self.related_model
+        if use_exists(self.column, self.filter_strategy, self.join_registry):
+            alias = aliased(self.related_model)
+            node = Node(alias, value, self.resource, self.related_schema, self.join_registry.subquery_registry())
+            filters, _ = node.resolve()
+            return related_exists(self.column, alias, filters), []
+
+        alias, joins = self.join_registry.join(self.column)
+        node = Node(alias, value, self.resource, self.related_schema, self.join_registry)
         filters, new_joins = node.resolve()
         joins.extend(new_joins)
         return filters, joins
@@ -146,14 +526,17 @@ class Node(object):
         :param type_filter: 'or' или 'and'
         :return:
         """
-        nodes = [Node(self.model, filter, self.resource, self.schema).resolve() for filter in self.filter_[type_filter]]
+        nodes = [
+            Node(self.model, filter, self.resource, self.schema, self.join_registry).resolve()
+            for filter in self.filter_[type_filter]
+        ]
         joins = []
         for i_node in nodes:
             joins.extend(i_node[1])
         op = and_ if type_filter == 'and' else or_
         return op(*[i_node[0] for i_node in nodes]), joins
 
-    @property
+    @cached_property
     def name(self):
         """Return the name of the node or raise a BadRequest exception
 
@@ -172,7 +555,7 @@ class Node(object):
 
         return name
 
-    @property
+    @cached_property
     def op(self):
         """Return the operator of the node
 
@@ -183,7 +566,7 @@ class Node(object):
         except KeyError:
             raise InvalidFilters("Can't find op of a filter")
 
-    @property
+    @cached_property
     def column(self):
         """Get the column object
         """
@@ -196,21 +579,23 @@ class Node(object):
         except AttributeError:
             raise InvalidFilters("{} has no attribute {}".format(self.model.__name__, model_field))
 
-    @property
+    @cached_property
+    def operators(self):
+        """Get the operators of the field of the node
+
+        :return FieldOperators: the operators of the field, compiled with the plan of the schema and model
+        """
+        return get_plan(self.schema, self.model).field_operators[self.name]
+
+    @cached_property
     def operator(self):
         """Get the function operator from his name
 
         :return callable: a callable to make operation on a column
         """
-        operators = (self.op, self.op + '_', '__' + self.op + '__')
+        return self.operators.operator(self.op, self.column)
 
-        for op in operators:
-            if hasattr(self.column, op):
-                return op
-
-        raise InvalidFilters("{} has no operator {}".format(self.column.key, self.op))
-
-    @property
+    @cached_property
     def value(self):
         """Get the value to filter on
 
@@ -229,7 +614,7 @@ class Node(object):
 
             return self.filter_['val']
 
-    @property
+    @cached_property
     def related_model(self):
         """Get the related model of a relationship field
 
@@ -242,7 +627,20 @@ class Node(object):
 
         return getattr(self.model, get_model_field(self.schema, relationship_field)).property.mapper.class_
 
-    @property
+    @cached_property
+    def filter_strategy(self):
+        """Get the filter strategy of a relationship field
+
+        :return str: one of FILTER_STRATEGIES
+        """
+        filter_strategy = self.schema._declared_fields[self.name].metadata.get('filter_strategy', 'exists')
+        if filter_strategy not in FILTER_STRATEGIES:
+            raise ValueError("Filter strategy of relationship {} has to be one of {}".format(
+                self.name, ', '.join(FILTER_STRATEGIES)
+            ))
+        return filter_strategy
+
+    @cached_property
     def related_schema(self):
         """Get the related schema of a relationship field
 
@@ -254,3 +652,94 @@ class Node(object):
             raise InvalidFilters("{} has no relationship attribute {}".format(self.schema.__name__, relationship_field))
 
         return self.schema._declared_fields[relationship_field].schema.__class__
+
+
+def matches_nothing(tree):
+    """Whether a compiled filter tree matches no object: the false constant, or a relationship filter whose tree
+    matches no related object. Only an and can be folded with it, a joined relationship filter isn't a constant.
+
+    :param tree: a simplified filter tree
+    :return bool: True if no object matches the tree
+    """
+    if isinstance(tree, ConstantFilter):
+        return not tree.value
+    return isinstance(tree, RelationshipFilter) and matches_nothing(tree.tree)
+
+
+def use_exists(relationship, filter_strategy, join_registry):
+    """Whether a relationship is filtered with an EXISTS subquery rather than with a join
+
+    :param InstrumentedAttribute relationship: the relationship attribute of a model or of an alias
+    :param str filter_strategy: the filter strategy of the relationship field
+    :param JoinRegistry join_registry: the aliases already joined to the query
+    :return bool: True for to-many relationships filtered with the "exists" strategy and inside EXISTS subqueries
+    """
+    return join_registry.subquery or (relationship.property.uselist and filter_strategy == 'exists')
+
+
+def related_exists(relationship, alias, filter_):
+    """Create the correlated EXISTS subquery filtering the related objects of a relationship
+
+    :param InstrumentedAttribute relationship: the relationship attribute of a model or of an alias
+    :param alias: the alias of the related model the filter is bound to
+    :param filter_: the filter of the related objects
+    :return: the EXISTS filter
+    """
+    relationship = relationship.of_type(alias)
+    if relationship.property.uselist:
+        return relationship.any(filter_)
+    return relationship.has(filter_)
+
+
+def filter_operator(column, operator, value, join_registry=None, method=None):
+    """Create the filter of an operator, the name of a column method. In / notin lists longer than the
+    large_in_list of the registry are bound as one parameter, so that neither the statement nor its parameters
+    grow with the list: an array compared with ANY / ALL with PostgreSQL, a json array read with json_each with
+    SQLite for integer and string columns whose values are plain integers and strings. Otherwise they are split in
+    several lists, to stay under the parameters limits.
+
+    :param InstrumentedAttribute column: the column to filter on
+    :param str operator: the name of the column method implementing the operator
+    :param value: the deserialized value
+    :param JoinRegistry join_registry: the registry of the query, for its dialect and large_in_list
+    :param callable method: the column method implementing the operator, if bound already
+    :return: the filter
+    """
+    if method is None:
+        method = getattr(column, operator)
+    if join_registry is None:
+        join_registry = JoinRegistry()
+    large_in_list = join_registry.large_in_list
+    if operator not in IN_OPERATORS or not isinstance(value, list) or len(value) <= large_in_list:
+        return method(value)
+
+    if join_registry.dialect == 'postgresql':
+        values = bindparam(None, value, type_=ARRAY(column.type))
+        return column == any_(values) if operator == 'in_' else column != all_(values)
+
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        python_type = None
+    if join_registry.dialect == 'sqlite' and python_type in (int, str) \
+            and all(item.__class__ in (int, str) for item in value):
+        values = func.json_each(bindparam(None, json.dumps(value))).table_valued('value')
+        return method(select(values.c.value))
+
+    filters = [method(value[i:i + large_in_list]) for i in range(0, len(value), large_in_list)]
+    return or_(*filters) if operator == 'in_' else and_(*filters)
+
+
+def freeze(value):
+    """Get a hashable version of a filter value to compare filters
+
+    :param value: a deserialized value
+    :return: the hashable value, a unique object if the value can't be hashed
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return object()
+    return value
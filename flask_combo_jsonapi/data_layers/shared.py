@@ -1,10 +1,15 @@
 from typing import Any
+from uuid import UUID
 
 from marshmallow import fields, ValidationError
+from sqlalchemy.orm import aliased
 
 from flask_combo_jsonapi.exceptions import InvalidFilters
 
 
+# default number of values above which the in / notin lists are bound as one parameter, see JoinRegistry
+LARGE_IN_LIST = 1000
+
 # Fields that are not of array type
 STANDARD_MARSHMALLOW_FIELDS = {
     fields.Dict,
@@ -27,6 +32,54 @@ STANDARD_MARSHMALLOW_FIELDS = {
 }
 
 
+def _integers(values):
+    if any(value.__class__ is not int and value.__class__ is not str for value in values):
+        raise TypeError
+    return list(map(int, values))
+
+
+def _strings(values):
+    if any(value.__class__ is not str for value in values):
+        raise TypeError
+    return values
+
+
+def _uuids(values):
+    return list(map(UUID, _strings(values)))
+
+
+# conversion of a whole list of values by marshmallow field type, for fields without validators
+FAST_DESERIALIZERS = {
+    fields.Integer: _integers,
+    fields.String: _strings,
+    fields.UUID: _uuids,
+}
+
+
+def deserialize_values(marshmallow_field: fields.Field, values: list) -> list:
+    """
+    Deserialize the list of values of an in / notin filter: duplicate values are dropped and the values of simple
+    fields are converted in one pass instead of going through the marshmallow field for each value
+    :param marshmallow_field: marshmallow field type
+    :param values: filter values
+    :return: the deserialized values, without duplicates
+    """
+    try:
+        values = list(dict.fromkeys(values))
+    except TypeError:
+        # unhashable values are left to the marshmallow field
+        return deserialize_field(marshmallow_field, values)
+
+    convert = FAST_DESERIALIZERS.get(type(marshmallow_field))
+    if convert is not None and not marshmallow_field.validators and not getattr(marshmallow_field, 'strict', False):
+        try:
+            return list(dict.fromkeys(convert(values)))
+        except (TypeError, ValueError):
+            # the marshmallow field reports the invalid value
+            pass
+    return list(dict.fromkeys(deserialize_field(marshmallow_field, values)))
+
+
 def deserialize_field(marshmallow_field: fields.Field, value: Any) -> Any:
     """
     Deserialize filter/sort value
@@ -44,7 +97,60 @@ def deserialize_field(marshmallow_field: fields.Field, value: Any) -> Any:
         raise InvalidFilters(f'Bad filter value: {value!r}')
 
 
-def create_filters_or_sorts(model, filter_or_sort_info, resource, Node):
+class JoinRegistry(object):
+    """Aliases of the related models joined to a query, by relationship of the model or alias they are joined to.
+
+    Filters and sorts along the same to-one relationship share one alias and one join. Nodes along a to-many
+    relationship get an alias each: with a shared alias, two conditions on the related objects would have to hold
+    for the same related object.
+
+    The registry of the filters inside an EXISTS subquery is a subquery registry: nothing can be joined to the
+    query from there, so relationships are filtered with EXISTS subqueries too. The registry records whether a
+    to-many relationship is joined, the query may then return an object several times.
+
+    The registry also carries what the filters need to know about the query they are bound to: the dialect of its
+    database and the length from which in / notin lists are bound as one parameter.
+    """
+
+    def __init__(self, subquery=False, dialect=None, large_in_list=LARGE_IN_LIST):
+        """Initialize a registry
+
+        :param bool subquery: whether the filters are bound inside an EXISTS subquery
+        :param str dialect: the name of the dialect of the database of the query
+        :param int large_in_list: the number of values above which an in / notin list is bound as one parameter
+        """
+        self.subquery = subquery
+        self.dialect = dialect
+        self.large_in_list = large_in_list
+        self.aliases = {}
+        self.to_many = False
+
+    def subquery_registry(self):
+        """Get a registry for the filters of an EXISTS subquery of the query
+
+        :return JoinRegistry: the registry of the subquery
+        """
+        return JoinRegistry(subquery=True, dialect=self.dialect, large_in_list=self.large_in_list)
+
+    def join(self, relationship):
+        """Get the alias of the related model of a relationship and the joins needed to use it
+
+        :param InstrumentedAttribute relationship: the relationship attribute of a model or of an alias
+        :return tuple: the alias and the joins to apply to the query, empty when the alias is already joined
+        """
+        key = (relationship.parent, relationship.key)
+        if key in self.aliases:
+            return self.aliases[key], []
+
+        alias = aliased(relationship.property.mapper.class_)
+        if relationship.property.uselist:
+            self.to_many = True
+        else:
+            self.aliases[key] = alias
+        return alias, [[alias, relationship]]
+
+
+def create_filters_or_sorts(model, filter_or_sort_info, resource, Node, join_registry=None):
     """
     Apply filters / sorts from filters / sorts information to base query
 
@@ -52,12 +158,15 @@ def create_filters_or_sorts(model, filter_or_sort_info, resource, Node):
     :param dict/list filter_or_sort_info: current node filter_or_sort information
     :param Node:
     :param Resource resource: the resource
+    :param JoinRegistry join_registry: the aliases already joined to the query
     """
     filters_or_sorts = []
     joins = []
     schema = getattr(resource, 'schema') if resource else None
+    if join_registry is None:
+        join_registry = JoinRegistry()
     for filter_or_sort in filter_or_sort_info:
-        filters_or_sort, join = Node(model, filter_or_sort, resource, schema).resolve()
+        filters_or_sort, join = Node(model, filter_or_sort, resource, schema, join_registry).resolve()
         filters_or_sorts.append(filters_or_sort)
         joins.extend(join)
 
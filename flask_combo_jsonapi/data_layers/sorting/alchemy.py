@@ -2,9 +2,8 @@
 from typing import Any, List, Tuple
 
 from sqlalchemy import sql
-from sqlalchemy.orm import aliased
 
-from flask_combo_jsonapi.data_layers.shared import create_filters_or_sorts
+from flask_combo_jsonapi.data_layers.shared import create_filters_or_sorts, JoinRegistry
 from flask_combo_jsonapi.exceptions import InvalidFilters, PluginMethodNotImplementedError, InvalidSort
 from flask_combo_jsonapi.schema import get_relationships, get_model_field
 from flask_combo_jsonapi.utils import SPLIT_REL
@@ -18,31 +17,34 @@ SortAndJoins = Tuple[
     List[Join],
 ]
 
-def create_sorts(model, sort_info, resource):
+def create_sorts(model, sort_info, resource, join_registry=None):
     """Apply sorts from sorts information to base query
 
     :param DeclarativeMeta model: the model of the node
     :param list sort_info: current node sort information
     :param Resource resource: the resource
+    :param JoinRegistry join_registry: the aliases already joined to the query
     """
-    return create_filters_or_sorts(model, sort_info, resource, Node)
+    return create_filters_or_sorts(model, sort_info, resource, Node, join_registry)
 
 
 class Node(object):
     """Helper to recursively create sorts with sqlalchemy according to sort querystring parameter"""
 
-    def __init__(self, model, sort_, resource, schema):
+    def __init__(self, model, sort_, resource, schema, join_registry=None):
         """Initialize an instance of a filter node
 
         :param Model model: an sqlalchemy model
         :param dict sort_: sorts information of the current node and deeper nodes
         :param Resource resource: the base resource to apply filters on
         :param Schema schema: the serializer of the resource
+        :param JoinRegistry join_registry: the aliases already joined to the query
         """
         self.model = model
         self.sort_ = sort_
         self.resource = resource
         self.schema = schema
+        self.join_registry = join_registry if join_registry is not None else JoinRegistry()
 
     @classmethod
     def create_sort(cls, marshmallow_field, model_column, order):
@@ -73,14 +75,13 @@ class Node(object):
 
     def resolve(self) -> SortAndJoins:
         """Create sort for a particular node of the sort tree"""
-        if hasattr(self.resource, 'plugins'):
-            for i_plugin in self.resource.plugins:
-                try:
-                    res = i_plugin.before_data_layers_sorting_alchemy_nested_resolve(self)
-                    if res is not None:
-                        return res
-                except PluginMethodNotImplementedError:
-                    pass
+        for hook in getattr(self.resource, '_plugin_hooks', {}).get('before_data_layers_sorting_alchemy_nested_resolve', ()):
+            try:
+                res = hook(self)
+                if res is not None:
+                    return res
+            except PluginMethodNotImplementedError:
+                pass
 
         field = self.sort_.get('field', '')
         if not hasattr(self.model, field) and SPLIT_REL not in field:
@@ -91,9 +92,10 @@ class Node(object):
                 'field': SPLIT_REL.join(field.split(SPLIT_REL)[1:]),
                 'order': self.sort_['order']
             }
-            alias = aliased(self.related_model)
-            joins = [[alias, self.column]]
-            node = Node(alias, value, self.resource, self.related_schema)
+            # validate the relationship before joining it
+            self.related_model
+            alias, joins = self.join_registry.join(self.column)
+            node = Node(alias, value, self.resource, self.related_schema, self.join_registry)
             filters, new_joins = node.resolve()
             joins.extend(new_joins)
             return filters, joins
@@ -1,13 +1,12 @@
 """Decorators to check headers and method requirements for each Api calls"""
 
-import simplejson as json
 from functools import wraps
 
-from flask import request, make_response, jsonify, current_app
+from flask import request, make_response, current_app
 
+from flask_combo_jsonapi.encoders import dumps
 from flask_combo_jsonapi.errors import jsonapi_errors, format_http_exception
 from flask_combo_jsonapi.exceptions import JsonApiException
-from flask_combo_jsonapi.utils import JSONEncoder
 
 
 def check_headers(func):
@@ -22,10 +21,10 @@ def check_headers(func):
             if 'Content-Type' in request.headers and\
                     'application/vnd.api+json' in request.headers['Content-Type'] and\
                     request.headers['Content-Type'] != 'application/vnd.api+json':
-                error = json.dumps(jsonapi_errors([{'source': '',
-                                                    'detail': "Content-Type header must be application/vnd.api+json",
-                                                    'title': 'Invalid request header',
-                                                    'status': '415'}]), cls=JSONEncoder)
+                error = dumps(jsonapi_errors([{'source': '',
+                                               'detail': "Content-Type header must be application/vnd.api+json",
+                                               'title': 'Invalid request header',
+                                               'status': '415'}]))
                 return make_response(error, 415, {'Content-Type': 'application/vnd.api+json'})
         if 'Accept' in request.headers:
             flag = False
@@ -36,11 +35,11 @@ def check_headers(func):
                 if 'application/vnd.api+json' in accept and accept.strip() != 'application/vnd.api+json':
                     flag = True
             if flag is True:
-                error = json.dumps(jsonapi_errors([{'source': '',
-                                                    'detail': ('Accept header must be application/vnd.api+json without'
-                                                               'media type parameters'),
-                                                    'title': 'Invalid request header',
-                                                    'status': '406'}]), cls=JSONEncoder)
+                error = dumps(jsonapi_errors([{'source': '',
+                                               'detail': ('Accept header must be application/vnd.api+json without'
+                                                          'media type parameters'),
+                                               'title': 'Invalid request header',
+                                               'status': '406'}]))
                 return make_response(error, 406, {'Content-Type': 'application/vnd.api+json'})
         return func(*args, **kwargs)
     return wrapper
@@ -79,13 +78,13 @@ def jsonapi_exception_formatter(func):
                 status = int(e.status)
             except ValueError:
                 status = e.status
-            return make_response(jsonify(jsonapi_errors([e.to_dict()])),
+            return make_response(dumps(jsonapi_errors([e.to_dict()])),
                                  status,
                                  headers)
         except Exception as e:
             api_ex = format_http_exception(e)
             if api_ex:
-                return make_response(jsonify(jsonapi_errors([api_ex.to_dict()])),
+                return make_response(dumps(jsonapi_errors([api_ex.to_dict()])),
                                      api_ex.status,
                                      headers)
 
@@ -109,7 +108,7 @@ def jsonapi_exception_formatter(func):
                                    id_=getattr(e, 'id', None),
                                    links=getattr(e, 'links', None),
                                    meta=getattr(e, 'meta', None))
-            return make_response(jsonify(jsonapi_errors([exc.to_dict()])),
+            return make_response(dumps(jsonapi_errors([exc.to_dict()])),
                                  exc.status,
                                  headers)
     return wrapper
@@ -0,0 +1,143 @@
+"""JSON encoders used to render the responses and the errors of the Api.
+
+The encoder is chosen with the JSON_ENCODER configuration key: "simplejson" (default), "json" (standard library),
+"ujson", "orjson" or an instance of a subclass of :class:`BaseEncoder`. Every encoder renders ``datetime`` as ISO
+8601 and ``UUID`` as string. simplejson renders ``Decimal`` as an exact number, the other encoders render it as a string
+so that no precision is silently lost through a float.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+import simplejson
+from flask import current_app
+
+from flask_combo_jsonapi.utils import JSONEncoder
+
+
+def default(obj):
+    """Serialize the values the json modules don't handle natively
+
+    :param obj: the value to serialize
+    :return: a json serializable value
+    """
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    elif isinstance(obj, UUID):
+        return str(obj)
+    elif isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+class BaseEncoder(object):
+    """Base class of the JSON encoders"""
+
+    def dumps(self, obj):
+        """Serialize a document
+
+        :param obj: the document to serialize
+        :return str or bytes: the json document
+        """
+        raise NotImplementedError
+
+
+class SimplejsonEncoder(BaseEncoder):
+    """Encoder based on simplejson, ``Decimal`` values are rendered without loss of precision"""
+
+    def dumps(self, obj):
+        return simplejson.dumps(obj, cls=JSONEncoder)
+
+
+class StdlibEncoder(BaseEncoder):
+    """Encoder based on the json module of the standard library"""
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=default)
+
+
+def decimals_to_str(obj):
+    """Replace the ``Decimal`` values of a document by strings
+
+    :param obj: the document
+    :return: the document without ``Decimal`` values
+    """
+    if isinstance(obj, dict):
+        return {key: decimals_to_str(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [decimals_to_str(value) for value in obj]
+    elif isinstance(obj, Decimal):
+        return str(obj)
+    return obj
+
+
+class UjsonEncoder(BaseEncoder):
+    """Encoder based on ujson. ujson renders ``Decimal`` natively as a float, so the ``Decimal`` values are replaced
+    by strings before the serialization.
+    """
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, obj):
+        return self.ujson.dumps(decimals_to_str(obj), default=default)
+
+
+class OrjsonEncoder(BaseEncoder):
+    """Encoder based on orjson, the documents are returned as bytes and given as is to the response. orjson
+    renders ``datetime`` and ``UUID`` natively, the same way as the other encoders.
+    """
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj):
+        return self.orjson.dumps(obj, default=default, option=self.option)
+
+
+ENCODERS = {
+    'simplejson': SimplejsonEncoder,
+    'json': StdlibEncoder,
+    'ujson': UjsonEncoder,
+    'orjson': OrjsonEncoder,
+}
+
+# encoders already built by name
+_encoders = {}
+
+
+def get_encoder(app=None):
+    """Get the JSON encoder configured for an application
+
+    :param Application app: a flask application, the current application by default
+    :return BaseEncoder: the encoder
+    """
+    encoder = (app or current_app).config.get('JSON_ENCODER') or 'simplejson'
+    if isinstance(encoder, BaseEncoder):
+        return encoder
+
+    try:
+        return _encoders[encoder]
+    except KeyError:
+        pass
+
+    if encoder not in ENCODERS:
+        raise ValueError("Unknown JSON encoder {}, available encoders are {}".format(encoder, ', '.join(ENCODERS)))
+    try:
+        _encoders[encoder] = ENCODERS[encoder]()
+    except ImportError:
+        raise ValueError("JSON encoder {} is not installed".format(encoder))
+    return _encoders[encoder]
+
+
+def dumps(obj):
+    """Serialize a document with the JSON encoder of the current application
+
+    :param obj: the document to serialize
+    :return str or bytes: the json document
+    """
+    return get_encoder().dumps(obj)
@@ -2,9 +2,139 @@
 
 from __future__ import division
 
-from copy import copy
+from datetime import date, datetime, time
+from decimal import Decimal
 from math import ceil
 from urllib.parse import urlencode
+from uuid import UUID
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from flask_combo_jsonapi.exceptions import BadRequest
+
+# pagination parameters of the cursor strategy
+CURSOR_KEYS = ('cursor', 'after', 'before')
+
+# values of the page[count] parameter
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+# types of the sort values stored in cursors that json can't represent
+CURSOR_VALUE_TYPES = {
+    'datetime': (datetime, datetime.isoformat, datetime.fromisoformat),
+    'date': (date, date.isoformat, date.fromisoformat),
+    'time': (time, time.isoformat, time.fromisoformat),
+    'decimal': (Decimal, str, Decimal),
+    'uuid': (UUID, str, UUID),
+}
+
+
+def is_cursor_pagination(pagination):
+    """Whether the cursor strategy of pagination is requested
+
+    :param dict pagination: the pagination information of the querystring
+    :return bool: True if a cursor parameter is in the pagination information
+    """
+    return any(key in pagination for key in CURSOR_KEYS)
+
+
+def is_paginated_relationship(querystring):
+    """Whether a page of the linkage of a to-many relationship is requested: unlike collections the linkage is
+    whole by default, it is paginated when the querystring gives a page size or a page number
+
+    :param QueryStringManager querystring: the managed querystring fields and values
+    :return bool: True if a page of the linkage is requested
+    """
+    if querystring.pagination.get('size') == 0:
+        return False
+    requested = getattr(querystring, 'requested_pagination', querystring.pagination)
+    return 'size' in requested or 'number' in requested
+
+
+def get_cursor_secret_key(config):
+    """Get the key signing the cursors: the CURSOR_SECRET_KEY or else the SECRET_KEY of the application
+
+    :param dict config: the configuration of the application
+    :return: the key or None if neither is configured
+    """
+    return config.get('CURSOR_SECRET_KEY') or config.get('SECRET_KEY')
+
+
+def allows_cursor_pagination(data_layer, config):
+    """Whether the cursor strategy of pagination is available with a data layer: the cursor_pagination parameter of
+    the data layer enables (True) or disables (False) it, by default it is available when a key signs the cursors
+
+    :param data_layer: the data layer of the resource
+    :param dict config: the configuration of the application
+    :return bool: True if cursors can be used
+    """
+    enabled = getattr(data_layer, 'cursor_pagination', None)
+    return enabled is not False and get_cursor_secret_key(config) is not None
+
+
+def check_cursor_pagination(resource, config):
+    """Check that the cursors of a resource enabling cursor pagination can be signed
+
+    :param Resource resource: a resource class
+    :param dict config: the configuration of the application
+    """
+    data_layer = getattr(resource, '_data_layer', None)
+    if getattr(data_layer, 'cursor_pagination', None) is True and get_cursor_secret_key(config) is None:
+        raise ValueError("Resource {} enables cursor pagination: you must set SECRET_KEY or CURSOR_SECRET_KEY in the "
+                         "configuration".format(resource.__name__))
+
+
+def get_cursor_serializer():
+    """Get the serializer signing the cursors with the secret key of the current application
+
+    :return URLSafeSerializer: the serializer
+    """
+    secret_key = get_cursor_secret_key(current_app.config)
+    if secret_key is None:
+        raise ValueError("You must set SECRET_KEY or CURSOR_SECRET_KEY in the configuration to use cursor pagination")
+    return URLSafeSerializer(secret_key, salt='flask-combo-jsonapi.cursor')
+
+
+def encode_cursor(values, sort):
+    """Create the opaque cursor of a row
+
+    :param list values: the values of the sort fields of the row, primary key included
+    :param str sort: the sort querystring parameter the values come from
+    :return str: the signed cursor
+    """
+    dumped_values = []
+    for value in values:
+        for name, (type_, dump, _) in CURSOR_VALUE_TYPES.items():
+            if isinstance(value, type_):
+                value = {'$type': name, 'value': dump(value)}
+                break
+        dumped_values.append(value)
+    return get_cursor_serializer().dumps({'sort': sort, 'values': dumped_values})
+
+
+def decode_cursor(cursor, sort, size, parameter='page[cursor]'):
+    """Read the values of a cursor
+
+    :param str cursor: the signed cursor
+    :param str sort: the sort querystring parameter of the request
+    :param int size: the number of sort fields, primary key included
+    :param str parameter: the querystring parameter of the cursor
+    :return list: the values of the sort fields of the row
+    """
+    try:
+        payload = get_cursor_serializer().loads(cursor)
+    except BadSignature:
+        raise BadRequest("Invalid cursor", source={'parameter': parameter})
+
+    if payload.get('sort') != sort or len(payload.get('values', ())) != size:
+        raise BadRequest("The cursor doesn't match the sort of the request", source={'parameter': parameter})
+
+    values = []
+    for value in payload['values']:
+        if isinstance(value, dict) and value.get('$type') in CURSOR_VALUE_TYPES:
+            value = CURSOR_VALUE_TYPES[value['$type']][2](value['value'])
+        values.append(value)
+    return values
 
 
 def add_pagination_links(data, object_count, querystring, base_url):
@@ -16,7 +146,7 @@ def add_pagination_links(data, object_count, querystring, base_url):
     :param str base_url: the base url for pagination
     """
     links = {}
-    all_qs_args = copy(querystring.querystring)
+    all_qs_args = dict(querystring.querystring)
 
     links['self'] = base_url
 
@@ -24,9 +154,14 @@ def add_pagination_links(data, object_count, querystring, base_url):
     if all_qs_args:
         links['self'] += '?' + urlencode(all_qs_args)
 
-    if querystring.pagination.get('size') != 0 and object_count > 1:
+    pagination = querystring.pagination
+    if is_cursor_pagination(pagination):
+        add_cursor_pagination_links(links, all_qs_args, querystring, base_url)
+    elif 'has_more' in (querystring.page_info or {}):
+        add_has_more_pagination_links(links, all_qs_args, querystring, base_url)
+    elif pagination.get('size') != 0 and object_count > 1:
         # compute last link
-        page_size = querystring.pagination.get('size')
+        page_size = pagination.get('size')
         last_page = int(ceil(object_count / page_size))
 
         if last_page > 1:
@@ -42,7 +177,7 @@ def add_pagination_links(data, object_count, querystring, base_url):
             links['last'] += '?' + urlencode(all_qs_args)
 
             # compute previous and next link
-            current_page = querystring.pagination.get('number') or 1
+            current_page = pagination.get('number') or 1
             if current_page > 1:
                 all_qs_args.update({'page[number]': current_page - 1})
                 links['prev'] = '?'.join((base_url, urlencode(all_qs_args)))
@@ -51,3 +186,48 @@ def add_pagination_links(data, object_count, querystring, base_url):
                 links['next'] = '?'.join((base_url, urlencode(all_qs_args)))
 
     data['links'] = links
+
+
+def add_cursor_pagination_links(links, all_qs_args, querystring, base_url):
+    """Add the links of the cursor strategy of pagination
+
+    :param dict links: the links of the result
+    :param dict all_qs_args: the querystring arguments of the request
+    :param QueryStringManager querystring: the managed querystring fields and values
+    :param str base_url: the base url for pagination
+    """
+    for key in CURSOR_KEYS:
+        all_qs_args.pop('page[{}]'.format(key), None)
+
+    links['first'] = '?'.join((base_url, urlencode(dict(all_qs_args, **{'page[cursor]': ''}))))
+
+    page_info = querystring.page_info or {}
+    if page_info.get('prev'):
+        links['prev'] = '?'.join((base_url, urlencode(dict(all_qs_args, **{'page[before]': page_info['prev']}))))
+    if page_info.get('next'):
+        links['next'] = '?'.join((base_url, urlencode(dict(all_qs_args, **{'page[after]': page_info['next']}))))
+
+
+def add_has_more_pagination_links(links, all_qs_args, querystring, base_url):
+    """Add the links of a page whose collection isn't counted: there is no last link and the next link is only
+    added when the data layer found a row after the page
+
+    :param dict links: the links of the result
+    :param dict all_qs_args: the querystring arguments of the request
+    :param QueryStringManager querystring: the managed querystring fields and values
+    :param str base_url: the base url for pagination
+    """
+    current_page = querystring.pagination.get('number') or 1
+    has_more = querystring.page_info['has_more']
+    if current_page == 1 and not has_more:
+        return
+
+    all_qs_args.pop('page[number]', None)
+    links['first'] = base_url
+    if all_qs_args:
+        links['first'] += '?' + urlencode(all_qs_args)
+
+    if current_page > 1:
+        links['prev'] = '?'.join((base_url, urlencode(dict(all_qs_args, **{'page[number]': current_page - 1}))))
+    if has_more:
+        links['next'] = '?'.join((base_url, urlencode(dict(all_qs_args, **{'page[number]': current_page + 1}))))
@@ -0,0 +1,311 @@
+"""Per-resource execution plan.
+
+The plan gathers everything the resource managers and the data layer used to re-derive from
+``schema._declared_fields`` on each request (relationship maps, model <-> schema field maps, id fields,
+related models and loader choices). It is compiled once by :meth:`Api.route` and then only read.
+"""
+from types import MappingProxyType
+
+from marshmallow import class_registry
+from marshmallow.base import SchemaABC
+from marshmallow_jsonapi.fields import Relationship, List, Nested
+from sqlalchemy.inspection import inspect
+from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.orm.interfaces import MANYTOONE
+
+from flask_combo_jsonapi.cache import LRUCache
+from flask_combo_jsonapi.exceptions import InvalidFilters
+
+# compiled plans shared by every resource using the same (schema, model) pair, routed resources keep their own
+_plans = LRUCache(maxsize=1024)
+
+# sqlalchemy loader strategies available to eager load included relationships
+LOADERS = ("joined", "selectin", "subquery")
+
+# suffix of the names of the custom filtering methods of marshmallow fields
+SQL_FILTER_SUFFIX = '_sql_filter_'
+
+# operators of the filters bound to the columns of the fields when a plan is compiled
+OPERATORS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'in_', 'notin_', 'like', 'ilike', 'notlike', 'notilike', 'is_',
+             'isnot', 'startswith', 'endswith', 'contains', 'match', 'between')
+
+
+class Frozen(object):
+    """Base of the compiled plans: their attributes can't be set once they are compiled, only the private caches of
+    the values resolved lazily"""
+
+    _frozen = False
+
+    def __setattr__(self, name, value):
+        if self._frozen and not name.startswith('_'):
+            raise AttributeError("{} is immutable".format(self.__class__.__name__))
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name):
+        if self._frozen:
+            raise AttributeError("{} is immutable".format(self.__class__.__name__))
+        super().__delattr__(name)
+
+
+class FieldOperators(Frozen):
+    """Operators of a schema field: the custom filtering methods of its marshmallow field and the methods of its
+    column implementing the standard operators, bound when the plan is compiled"""
+
+    def __init__(self, marshmallow_field, column=None):
+        """Collect the custom filtering methods of a marshmallow field and bind the operators of its column
+
+        :param marshmallow_field: the marshmallow field
+        :param InstrumentedAttribute column: the column of the field in the model of the plan (may be None)
+        """
+        self.marshmallow_field = marshmallow_field
+        self.sql_filters = MappingProxyType({
+            name[1:-len(SQL_FILTER_SUFFIX)]: getattr(marshmallow_field, name)
+            for name in dir(marshmallow_field)
+            if name.startswith('_') and name.endswith(SQL_FILTER_SUFFIX) and len(name) > len(SQL_FILTER_SUFFIX) + 1
+        })
+        self.column = column
+        operators = {}
+        methods = {}
+        if column is not None:
+            for op in OPERATORS:
+                name = self._resolve(op, column)
+                if name is not None:
+                    operators[op] = name
+                    methods[name] = getattr(column, name)
+        self.operators = MappingProxyType(operators)
+        self.methods = MappingProxyType(methods)
+        self._frozen = True
+
+    @staticmethod
+    def _resolve(op, column):
+        for name in (op, op + '_', '__' + op + '__'):
+            if hasattr(column, name):
+                return name
+        return None
+
+    def operator(self, op, column):
+        """Get the name of the column method implementing an operator
+
+        :param str op: the operator from filters information
+        :param InstrumentedAttribute column: the column of the field
+        :return str: the name of the method
+        """
+        if op in self.operators:
+            return self.operators[op]
+        name = self._resolve(op, column)
+        if name is None:
+            raise InvalidFilters("{} has no operator {}".format(column.key, op))
+        return name
+
+    def method(self, operator, column):
+        """Get the column method implementing an operator, bound already when the column is the one of the plan
+
+        :param str operator: the name of the column method
+        :param InstrumentedAttribute column: the column to filter on, of the model or of an alias
+        :return callable: the bound method
+        """
+        if column is self.column and operator in self.methods:
+            return self.methods[operator]
+        return getattr(column, operator)
+
+
+class RelationshipPlan(Frozen):
+    """Compiled information about a relationship field of a schema"""
+
+    def __init__(self, name, field, attribute, model):
+        """Initialize a relationship plan
+
+        :param str name: the name of the schema field
+        :param Relationship field: the marshmallow field
+        :param str attribute: the name of the model field
+        :param DeclarativeMeta model: the model owning the relationship (may be None)
+        """
+        self.name = name
+        self.field = field
+        self.attribute = attribute
+        self.type_ = field.type_
+        self.many = field.many
+        self.model = model
+        self._loader = None
+        self._linkage_attribute = False
+        self._related_model = None
+        self._id_field = None
+        self._related_schema = None
+        self._frozen = True
+
+    @property
+    def related_model(self):
+        """The related model. Resolved lazily so that compiling a plan does not force the
+        configuration of sqlalchemy mappers.
+        """
+        if self._related_model is None and self.model is not None:
+            try:
+                self._related_model = getattr(self.model, self.attribute).property.mapper.class_
+            except AttributeError:
+                pass
+        return self._related_model
+
+    @property
+    def loader(self):
+        """The loader strategy of the relationship when it is included: the "loader" of the metadata of the field
+        if any, otherwise "joined" for to-one relationships and "selectin" for to-many relationships, which
+        would multiply the rows of a joined query.
+        """
+        if self._loader is None:
+            loader = self.field.metadata.get("loader")
+            if loader is None:
+                many = self.many
+                if self.related_model is not None:
+                    many = getattr(self.model, self.attribute).property.uselist
+                loader = "selectin" if many else "joined"
+            elif loader not in LOADERS:
+                raise ValueError(f"Loader of relationship {self.name} has to be one of {', '.join(LOADERS)}")
+            self._loader = loader
+        return self._loader
+
+    @property
+    def linkage_attribute(self):
+        """The model attribute of the foreign key holding the id of the related object of a many-to-one
+        relationship, so that its resource linkage can be rendered without loading the related object. None for
+        other relationships.
+        """
+        if self._linkage_attribute is False:
+            self._linkage_attribute = None
+            if self.related_model is not None:
+                prop = getattr(self.model, self.attribute).property
+                if prop.direction is MANYTOONE and len(prop.local_remote_pairs) == 1:
+                    local_column, remote_column = prop.local_remote_pairs[0]
+                    try:
+                        remote_attribute = prop.mapper.get_property_by_column(remote_column).key
+                        local_attribute = prop.parent.get_property_by_column(local_column).key
+                    except Exception:
+                        pass
+                    else:
+                        if remote_attribute == self.id_field:
+                            self._linkage_attribute = local_attribute
+        return self._linkage_attribute
+
+    @property
+    def id_field(self):
+        """The identifier field of the related model. Resolved lazily because the related schema may not
+        be registered yet when the plan is compiled.
+        """
+        if self._id_field is None:
+            self._id_field = self.field.id_field
+        return self._id_field
+
+    @property
+    def related_schema(self):
+        """The related schema class"""
+        if self._related_schema is None:
+            related_schema = self.field.__dict__['_Relationship__schema']
+            if isinstance(related_schema, SchemaABC):
+                related_schema = related_schema.__class__
+            elif isinstance(related_schema, str):
+                related_schema = class_registry.get_class(related_schema)
+            self._related_schema = related_schema
+        return self._related_schema
+
+    @property
+    def related_plan(self):
+        """The plan of the related schema and model"""
+        return get_plan(self.related_schema, self.related_model)
+
+
+class ResourcePlan(Frozen):
+    """Immutable description of a schema bound to a model"""
+
+    def __init__(self, schema, model=None):
+        """Compile the plan
+
+        :param Schema schema: a marshmallow schema class
+        :param DeclarativeMeta model: an sqlalchemy model
+        """
+        self.schema = schema
+        self.model = model
+
+        schema_to_model = {}
+        model_to_schema = {}
+        relationships = {}
+        nested_fields = []
+        for key, value in schema._declared_fields.items():
+            attribute = value.attribute if value.attribute is not None else key
+            schema_to_model[key] = attribute
+            model_to_schema.setdefault(attribute, key)
+            if isinstance(value, Relationship):
+                relationships[key] = RelationshipPlan(key, value, attribute, model)
+            elif isinstance(value, List) and isinstance(value.inner, Nested) \
+                    and not isinstance(value.inner, Relationship):
+                nested_fields.append(key)
+            elif isinstance(value, Nested):
+                nested_fields.append(key)
+
+        self.schema_to_model = MappingProxyType(schema_to_model)
+        self.model_to_schema = MappingProxyType(model_to_schema)
+        self.relationships = MappingProxyType(relationships)
+        self.relationships_by_attribute = MappingProxyType(
+            {rel.attribute: rel for rel in relationships.values()}
+        )
+        self.relationship_fields = tuple(relationships)
+        self.relationship_model_fields = tuple(rel.attribute for rel in relationships.values())
+        self.nested_fields = tuple(nested_fields)
+        self.nested_model_fields = tuple(schema_to_model[key] for key in nested_fields)
+        self.join_fields = self.relationship_model_fields + self.nested_model_fields
+        self.join_fields_set = frozenset(self.join_fields)
+
+        field_operators = {}
+        for key, value in schema._declared_fields.items():
+            column = None
+            if model is not None and key not in relationships:
+                column = getattr(model, schema_to_model[key], None)
+                if not isinstance(column, QueryableAttribute):
+                    column = None
+            field_operators[key] = FieldOperators(value, column)
+        self.field_operators = MappingProxyType(field_operators)
+
+        self.id_field = None
+        if model is not None:
+            try:
+                self.id_field = inspect(model).primary_key[0].key
+            except Exception:
+                pass
+        self._frozen = True
+
+
+def get_plan(schema, model=None):
+    """Get the compiled plan of a schema bound to a model
+
+    :param Schema schema: a marshmallow schema class
+    :param DeclarativeMeta model: an sqlalchemy model
+    :return ResourcePlan: the plan
+    """
+    key = (schema, model)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans.setdefault(key, ResourcePlan(schema, model))
+    return plan
+
+
+def get_resource_plan(resource):
+    """Get the plan of a resource. Resources routed through the Api have it compiled already,
+    other ones (used directly, with a swapped schema, or whose data layer was bound after routing) are compiled
+    on demand.
+
+    :param Resource resource: a resource class or instance
+    :return ResourcePlan: the plan
+    """
+    plan = getattr(resource, '_plan', None)
+    model = getattr(getattr(resource, '_data_layer', None), 'model', None)
+    if plan is not None and plan.schema is resource.schema and plan.model is model:
+        return plan
+    return get_plan(resource.schema, model)
+
+
+def compile_resource_plan(resource):
+    """Compile the plan of a resource and store it on the resource class
+
+    :param Resource resource: a resource class
+    """
+    if getattr(resource, 'schema', None) is None:
+        return
+    resource._plan = get_plan(resource.schema, getattr(getattr(resource, '_data_layer', None), 'model', None))
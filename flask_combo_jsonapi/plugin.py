@@ -1,5 +1,6 @@
 """Base class for Plugin classes."""
-from typing import List, Tuple, Dict, Any
+from types import MappingProxyType
+from typing import List, Tuple, Dict, Any, Callable, Iterable, Mapping
 
 from sqlalchemy.orm import Query
 
@@ -209,3 +210,26 @@ class BasePlugin(object):
         :return:
         """
         raise PluginMethodNotImplementedError
+
+
+PLUGIN_HOOKS = tuple(name for name, value in vars(BasePlugin).items() if callable(value) and not name.startswith('_'))
+
+
+def build_plugin_hooks(plugins: Iterable[Any]) -> Mapping[str, Tuple[Callable, ...]]:
+    """
+    Build the dispatch table of plugin hooks: for each hook only the plugins overriding it are listed,
+    so calling the hooks doesn't raise and catch PluginMethodNotImplementedError for every plugin
+    :param plugins: list of plugins
+    :return: read-only mapping of the hook name to the bound methods implementing it
+    """
+    hooks = {}
+    for name in PLUGIN_HOOKS:
+        base_method = getattr(BasePlugin, name)
+        implemented = tuple(
+            getattr(i_plugin, name)
+            for i_plugin in plugins
+            if getattr(type(i_plugin), name, base_method) is not base_method
+        )
+        if implemented:
+            hooks[name] = implemented
+    return MappingProxyType(hooks)
@@ -1,16 +1,24 @@
 """Helper to deal with querystring parameters according to jsonapi specification"""
 
+from types import MappingProxyType
+
 import simplejson as json
 
 from flask import current_app
 
 from flask_combo_jsonapi.exceptions import BadRequest, InvalidFilters, InvalidSort, InvalidField, InvalidInclude
-from flask_combo_jsonapi.schema import get_model_field, get_relationships, get_schema_from_type
-from flask_combo_jsonapi.utils import SPLIT_REL
+from flask_combo_jsonapi.pagination import CURSOR_KEYS, COUNT_MODES
+from flask_combo_jsonapi.plan import get_plan
+from flask_combo_jsonapi.schema import get_schema_from_type
+from flask_combo_jsonapi.utils import SPLIT_REL, cached_property
 
 
 class QueryStringManager(object):
-    """Querystring parser according to jsonapi reference"""
+    """Querystring parser according to jsonapi reference
+
+    The querystring is grouped once at initialization and every parsed value (filters, pagination, fields,
+    sorting, include) is computed on first access and then cached. Cached values are read-only.
+    """
 
     MANAGED_KEYS = (
         'filter',
@@ -31,6 +39,15 @@ class QueryStringManager(object):
 
         self.qs = querystring
         self.schema = schema
+        # information about the page computed by the data layer, like the cursors of the previous and next pages
+        # or whether a page follows an uncounted one
+        self.page_info = None
+
+        # one pass over the querystring: group `name[item]` keys by their name
+        self._params = {}
+        for key, value in querystring.items():
+            name, bracket, _ = key.partition('[')
+            self._params.setdefault(name if bracket else key, []).append((key, value))
 
     def _get_key_values(self, name):
         """Return a dict containing key / values items for a given key, used for items like filters, page, etc.
@@ -40,22 +57,27 @@ class QueryStringManager(object):
         """
         results = {}
 
-        for key, value in self.qs.items():
-            try:
-                if not key.startswith(name):
-                    continue
+        stem = name.partition('[')[0]
+        for param_name, items in self._params.items():
+            if not param_name.startswith(stem):
+                continue
 
-                key_start = key.index('[') + 1
-                key_end = key.index(']')
-                item_key = key[key_start:key_end]
+            for key, value in items:
+                try:
+                    if not key.startswith(name):
+                        continue
 
-                if ',' in value:
-                    item_value = value.split(',')
-                else:
-                    item_value = value
-                results.update({item_key: item_value})
-            except Exception:
-                raise BadRequest("Parse error", source={'parameter': key})
+                    key_start = key.index('[') + 1
+                    key_end = key.index(']')
+                    item_key = key[key_start:key_end]
+
+                    if ',' in value:
+                        item_value = value.split(',')
+                    else:
+                        item_value = value
+                    results.update({item_key: item_value})
+                except Exception:
+                    raise BadRequest("Parse error", source={'parameter': key})
 
         return results
 
@@ -73,20 +95,21 @@ class QueryStringManager(object):
         return filter_list
 
 
-    @property
+    @cached_property
     def querystring(self):
         """Return original querystring but containing only managed keys
 
-        :return dict: dict of managed querystring parameter
+        :return dict: read-only dict of managed querystring parameter
         """
-        return {key: value for (key, value) in self.qs.items()
-                if key.startswith(self.MANAGED_KEYS) or self._get_key_values('filter[')}
+        simple_filters = bool(self._get_key_values('filter['))
+        return MappingProxyType({key: value for (key, value) in self.qs.items()
+                                 if key.startswith(self.MANAGED_KEYS) or simple_filters})
 
-    @property
+    @cached_property
     def filters(self):
         """Return filters from query string.
 
-        :return list: filter information
+        :return tuple: filter information
         """
         results = []
         filters = self.qs.get('filter')
@@ -95,26 +118,46 @@ class QueryStringManager(object):
                 results.extend(json.loads(filters))
             except (ValueError, TypeError):
                 raise InvalidFilters("Parse error")
-        if self._get_key_values('filter['):
-            results.extend(self._simple_filters(self._get_key_values('filter[')))
-        return results
-
-    @property
-    def pagination(self):
-        """Return parameters page[size] and page[number) as a dict.
-        If missing parmeter `size` then default parameter PAGE_SIZE is used.
+        simple_filters = self._get_key_values('filter[')
+        if simple_filters:
+            results.extend(self._simple_filters(simple_filters))
+        return tuple(results)
 
-        :return dict: a dict of pagination information
-
-        Example with number strategy::
+    @cached_property
+    def filters_key(self):
+        """Return a hashable representation of the raw filter parameters, used to cache the compiled filters.
 
-            >>> query_string = {'page[number]': '25', 'page[size]': '10'}
-            >>> parsed_query.pagination
-            {'number': 25, 'size': 10}
+        :return tuple: the raw filter parameters or None if there is no filter parameter
+            or if the filters are not computed from the raw parameters only (the class overrides `filters`)
+        """
+        if type(self).filters is not QueryStringManager.filters:
+            return None
+        if 'filter' not in self._params:
+            return None
+        return tuple(
+            (key, value if isinstance(value, str) else tuple(value))
+            for key, value in sorted(self._params['filter'])
+        )
+
+    @cached_property
+    def requested_pagination(self):
+        """Return the pagination parameters given in the querystring, parsed and checked, before the default page
+        size is applied: it tells whether the client asked for a page size or a page number.
+
+        :return dict: a read-only dict of the requested pagination information
         """
         # check values type
         result = self._get_key_values('page')
         for key, value in result.items():
+            if key in CURSOR_KEYS:
+                if not isinstance(value, str):
+                    raise BadRequest("Parse error", source={'parameter': 'page[{}]'.format(key)})
+                continue
+            if key == 'count':
+                if value not in COUNT_MODES:
+                    raise BadRequest("page[count] must be one of {}".format(', '.join(COUNT_MODES)),
+                                     source={'parameter': 'page[count]'})
+                continue
             if key not in ('number', 'size'):
                 raise BadRequest("{} is not a valid parameter of pagination".format(key), source={'parameter': 'page'})
             try:
@@ -122,35 +165,70 @@ class QueryStringManager(object):
             except ValueError:
                 raise BadRequest("Parse error", source={'parameter': 'page[{}]'.format(key)})
 
-        result.setdefault('size', current_app.config.get('PAGE_SIZE', 30))
+        return MappingProxyType(result)
 
-        if current_app.config.get('ALLOW_DISABLE_PAGINATION', True) is False and result.get('size') == 0:
+    @cached_property
+    def pagination(self):
+        """Return parameters page[size] and page[number) as a dict.
+        If missing parmeter `size` then default parameter PAGE_SIZE is used.
+
+        :return dict: a read-only dict of pagination information
+
+        Example with number strategy::
+
+            >>> query_string = {'page[number]': '25', 'page[size]': '10'}
+            >>> dict(parsed_query.pagination)
+            {'number': 25, 'size': 10}
+
+        page[count] is kept as is, it is one of exact, estimate or none.
+
+        Example with cursor strategy (page[cursor], page[after] or page[before])::
+
+            >>> query_string = {'page[after]': 'eyJzb3J0Ijo...', 'page[size]': '10'}
+            >>> dict(parsed_query.pagination)
+            {'after': 'eyJzb3J0Ijo...', 'size': 10}
+        """
+        result = dict(self.requested_pagination)
+
+        config = current_app.config
+        result.setdefault('size', config.get('PAGE_SIZE', 30))
+
+        if config.get('ALLOW_DISABLE_PAGINATION', True) is False and result.get('size') == 0:
             raise BadRequest("You are not allowed to disable pagination", source={'parameter': 'page[size]'})
 
-        if current_app.config.get('MAX_PAGE_SIZE') is not None and 'size' in result:
-            if int(result['size']) > current_app.config['MAX_PAGE_SIZE']:
-                raise BadRequest("Maximum page size is {}".format(current_app.config['MAX_PAGE_SIZE']),
+        if config.get('MAX_PAGE_SIZE') is not None and 'size' in result:
+            if int(result['size']) > config['MAX_PAGE_SIZE']:
+                raise BadRequest("Maximum page size is {}".format(config['MAX_PAGE_SIZE']),
                                  source={'parameter': 'page[size]'})
 
-        return result
+        cursor_keys = [key for key in CURSOR_KEYS if key in result]
+        if len(cursor_keys) > 1 or (cursor_keys and 'number' in result):
+            raise BadRequest("page[{}] can't be used with page[{}]".format(
+                cursor_keys[0], cursor_keys[1] if len(cursor_keys) > 1 else 'number'
+            ), source={'parameter': 'page[{}]'.format(cursor_keys[0])})
+        if cursor_keys and result['size'] == 0:
+            raise BadRequest("You can't disable pagination with a cursor", source={'parameter': 'page[size]'})
+
+        return MappingProxyType(result)
 
-    @property
+    @cached_property
     def fields(self):
         """Return fields wanted by client.
 
-        :return dict: a dict of sparse fieldsets information
+        :return dict: a read-only dict of sparse fieldsets information
 
         Return value will be a dict containing all fields by resource, for example::
 
             {
-                "user": ['name', 'email'],
+                "user": ('name', 'email'),
             }
 
         """
         result = self._get_key_values('fields')
         for key, value in result.items():
             if not isinstance(value, list):
-                result[key] = [value]
+                value = [value]
+            result[key] = tuple(value)
 
         for key, value in result.items():
             schema = get_schema_from_type(key)
@@ -158,43 +236,44 @@ class QueryStringManager(object):
                 if obj not in schema._declared_fields:
                     raise InvalidField("{} has no attribute {}".format(schema.__name__, obj))
 
-        return result
+        return MappingProxyType(result)
 
-    @property
+    @cached_property
     def sorting(self):
         """Return fields to sort by including sort name for SQLAlchemy and row
         sort parameter for other ORMs
 
-        :return list: a list of sorting information
+        :return tuple: sorting information
 
         Example of return value::
 
-            [
+            (
                 {'field': 'created_at', 'order': 'desc'},
-            ]
+            )
 
         """
         if self.qs.get('sort'):
             sorting_results = []
+            plan = get_plan(self.schema)
             for sort_field in self.qs['sort'].split(','):
                 field = sort_field.replace('-', '')
                 if SPLIT_REL not in field:
-                    if field not in self.schema._declared_fields:
+                    if field not in plan.schema_to_model:
                         raise InvalidSort("{} has no attribute {}".format(self.schema.__name__, field))
-                    if field in get_relationships(self.schema):
+                    if field in plan.relationships:
                         raise InvalidSort("You can't sort on {} because it is a relationship field".format(field))
-                    field = get_model_field(self.schema, field)
+                    field = plan.schema_to_model[field]
                 order = 'desc' if sort_field.startswith('-') else 'asc'
                 sorting_results.append({'field': field, 'order': order})
-            return sorting_results
+            return tuple(sorting_results)
 
-        return []
+        return ()
 
-    @property
+    @cached_property
     def include(self):
         """Return fields to include
 
-        :return list: a list of include information
+        :return tuple: include information
         """
         include_param = self.qs.get('include', [])
 
@@ -204,4 +283,4 @@ class QueryStringManager(object):
                     raise InvalidInclude("You can't use include through more than {} relationships"
                                          .format(current_app.config['MAX_INCLUDE_DEPTH']))
 
-        return include_param.split(',') if include_param else []
+        return tuple(include_param.split(',')) if include_param else ()
@@ -2,8 +2,7 @@
 
 import inspect
 import typing as t
-
-import simplejson as json
+from types import MappingProxyType
 
 from werkzeug.wrappers import Response
 from flask import request, url_for, make_response
@@ -16,11 +15,14 @@ from flask_combo_jsonapi.querystring import QueryStringManager as QSManager
 from flask_combo_jsonapi.pagination import add_pagination_links
 from flask_combo_jsonapi.exceptions import InvalidType, BadRequest, RelationNotFound, PluginMethodNotImplementedError, \
     ObjectNotFound
+from flask_combo_jsonapi.encoders import dumps
 from flask_combo_jsonapi.decorators import check_headers, check_method_requirements, jsonapi_exception_formatter
-from flask_combo_jsonapi.schema import compute_schema, get_relationships, get_model_field
+from flask_combo_jsonapi.schema import compute_schema, discard_schema, release_schemas, use_linkage_attributes
+from flask_combo_jsonapi.plan import get_resource_plan
+from flask_combo_jsonapi.serializer import compile_serializer
+from flask_combo_jsonapi.plugin import build_plugin_hooks
 from flask_combo_jsonapi.data_layers.base import BaseDataLayer
 from flask_combo_jsonapi.data_layers.alchemy import SqlalchemyDataLayer
-from flask_combo_jsonapi.utils import JSONEncoder
 
 
 class Resource(MethodView):
@@ -28,17 +30,18 @@ class Resource(MethodView):
 
     qs_manager_class = QSManager
 
-    def __new__(cls):
-        """Constructor of a resource instance"""
-        if hasattr(cls, "_data_layer"):
-            cls._data_layer.resource = cls
-            cls._data_layer.post_init()
+    # dispatch table of plugin hooks, see flask_combo_jsonapi.plugin.build_plugin_hooks
+    _plugin_hooks = MappingProxyType({})
 
-        return super().__new__(cls)
+    # dump objects with serializers generated for the computed schemas, see flask_combo_jsonapi.serializer
+    fast_serializer = False
 
     @jsonapi_exception_formatter
     def dispatch_request(self, *args, **kwargs):
         """Logic of how to handle a request"""
+        if hasattr(self, "_data_layer"):
+            self._data_layer.init_request(self)
+
         method = getattr(self, request.method.lower(), None)
         if method is None and request.method == "HEAD":
             method = getattr(self, "get", None)
@@ -48,7 +51,10 @@ class Resource(MethodView):
 
         headers = {"Content-Type": "application/vnd.api+json"}
 
-        response = method(*args, **kwargs)
+        try:
+            response = method(*args, **kwargs)
+        finally:
+            release_schemas()
 
         if isinstance(response, Response):
             response.headers.add("Content-Type", "application/vnd.api+json")
@@ -57,7 +63,7 @@ class Resource(MethodView):
         if not isinstance(response, tuple):
             if isinstance(response, dict):
                 response.update({"jsonapi": {"version": "1.0"}})
-            return make_response(json.dumps(response, cls=JSONEncoder), 200, headers)
+            return make_response(dumps(response), 200, headers)
 
         try:
             data, status_code, headers = response
@@ -80,10 +86,35 @@ class Resource(MethodView):
         elif isinstance(data, str):
             json_reponse = data
         else:
-            json_reponse = json.dumps(data, cls=JSONEncoder)
+            json_reponse = dumps(data)
 
         return make_response(json_reponse, status_code, headers)
 
+    def _prepare_schema(self, schema, hook_name, args, kwargs):
+        """Run the plugin hooks initializing a computed schema, then render the resource linkage from the foreign
+        keys and compile the serializer of the schema
+
+        :param Schema schema: a computed schema
+        :param str hook_name: the plugin hook to run
+        :param tuple args: the args of the view
+        :param dict kwargs: the kwargs of the view
+        """
+        hooks = self._plugin_hooks.get(hook_name, ())
+        if hooks:
+            # plugins may alter the schema, it must not be reused by another request
+            discard_schema(schema)
+        for hook in hooks:
+            try:
+                hook(
+                    *args, schema=schema, model=self.data_layer["model"], **kwargs
+                )
+            except PluginMethodNotImplementedError:
+                pass
+
+        use_linkage_attributes(schema, get_resource_plan(self))
+        if self.fast_serializer:
+            compile_serializer(schema)
+
 
 class ResourceList(Resource):
     """Base class of a resource list manager"""
@@ -109,6 +140,8 @@ class ResourceList(Resource):
             data_layer_cls = cls.data_layer.get("class", SqlalchemyDataLayer)
             data_layer_kwargs = cls.data_layer
             cls._data_layer = data_layer_cls(data_layer_kwargs)
+            cls._data_layer.resource = cls
+            cls._data_layer.post_init()
 
         if check_headers not in cls.decorators:
             decorators = [check_headers,]
@@ -117,6 +150,7 @@ class ResourceList(Resource):
 
         if not hasattr(cls, "plugins"):
             cls.plugins = []
+        cls._plugin_hooks = build_plugin_hooks(cls.plugins)
 
     @check_method_requirements
     def get(self, *args, **kwargs):
@@ -132,15 +166,9 @@ class ResourceList(Resource):
 
         self.before_marshmallow(args, kwargs)
 
-        schema = compute_schema(self.schema, schema_kwargs, qs, qs.include)
+        schema = compute_schema(self.schema, schema_kwargs, qs, qs.include, compiled=self.fast_serializer)
 
-        for i_plugins in self.plugins:
-            try:
-                i_plugins.after_init_schema_in_resource_list_get(
-                    *args, schema=schema, model=self.data_layer["model"], **kwargs
-                )
-            except PluginMethodNotImplementedError:
-                pass
+        self._prepare_schema(schema, "after_init_schema_in_resource_list_get", args, kwargs)
 
         result = schema.dump(objects)
 
@@ -160,15 +188,11 @@ class ResourceList(Resource):
 
         qs = self.qs_manager_class(request.args, self.schema)
 
-        schema = compute_schema(self.schema, getattr(self, "post_schema_kwargs", dict()), qs, qs.include)
+        schema = compute_schema(
+            self.schema, getattr(self, "post_schema_kwargs", dict()), qs, qs.include, compiled=self.fast_serializer
+        )
 
-        for i_plugins in self.plugins:
-            try:
-                i_plugins.after_init_schema_in_resource_list_post(
-                    *args, schema=schema, model=self.data_layer["model"], **kwargs
-                )
-            except PluginMethodNotImplementedError:
-                pass
+        self._prepare_schema(schema, "after_init_schema_in_resource_list_post", args, kwargs)
 
         try:
             data = schema.load(json_data)
@@ -253,6 +277,8 @@ class ResourceDetail(Resource):
             data_layer_cls = cls.data_layer.get("class", SqlalchemyDataLayer)
             data_layer_kwargs = cls.data_layer
             cls._data_layer = data_layer_cls(data_layer_kwargs)
+            cls._data_layer.resource = cls
+            cls._data_layer.post_init()
 
         if check_headers not in cls.decorators:
             decorators = [check_headers,]
@@ -261,6 +287,7 @@ class ResourceDetail(Resource):
 
         if not hasattr(cls, "plugins"):
             cls.plugins = []
+        cls._plugin_hooks = build_plugin_hooks(cls.plugins)
 
     @check_method_requirements
     def get(self, *args, **kwargs):
@@ -278,15 +305,11 @@ class ResourceDetail(Resource):
 
         self.before_marshmallow(args, kwargs)
 
-        schema = compute_schema(self.schema, getattr(self, "get_schema_kwargs", dict()), qs, qs.include)
+        schema = compute_schema(
+            self.schema, getattr(self, "get_schema_kwargs", dict()), qs, qs.include, compiled=self.fast_serializer
+        )
 
-        for i_plugins in self.plugins:
-            try:
-                i_plugins.after_init_schema_in_resource_detail_get(
-                    *args, schema=schema, model=self.data_layer["model"], **kwargs
-                )
-            except PluginMethodNotImplementedError:
-                pass
+        self._prepare_schema(schema, "after_init_schema_in_resource_detail_get", args, kwargs)
 
         result = schema.dump(obj)
 
@@ -305,15 +328,9 @@ class ResourceDetail(Resource):
 
         self.before_marshmallow(args, kwargs)
 
-        schema = compute_schema(self.schema, schema_kwargs, qs, qs.include)
+        schema = compute_schema(self.schema, schema_kwargs, qs, qs.include, compiled=self.fast_serializer)
 
-        for i_plugins in self.plugins:
-            try:
-                i_plugins.after_init_schema_in_resource_detail_patch(
-                    *args, schema=schema, model=self.data_layer["model"], **kwargs
-                )
-            except PluginMethodNotImplementedError:
-                pass
+        self._prepare_schema(schema, "after_init_schema_in_resource_detail_patch", args, kwargs)
 
         if "data" not in json_data:
             raise BadRequest('Missing "data" node', source={"pointer": "/data"})
@@ -427,6 +444,8 @@ class ResourceRelationship(Resource):
             data_layer_cls = cls.data_layer.get("class", SqlalchemyDataLayer)
             data_layer_kwargs = cls.data_layer
             cls._data_layer = data_layer_cls(data_layer_kwargs)
+            cls._data_layer.resource = cls
+            cls._data_layer.post_init()
 
         if check_headers not in cls.decorators:
             decorators = [check_headers,]
@@ -435,6 +454,7 @@ class ResourceRelationship(Resource):
 
         if not hasattr(cls, "plugins"):
             cls.plugins = []
+        cls._plugin_hooks = build_plugin_hooks(cls.plugins)
 
     @check_method_requirements
     def get(self, *args, **kwargs):
@@ -443,7 +463,11 @@ class ResourceRelationship(Resource):
 
         relationship_field, model_relationship_field, related_type_, related_id_field = self._get_relationship_data()
 
-        obj, data = self._data_layer.get_relationship(model_relationship_field, related_type_, related_id_field, kwargs)
+        qs = self.qs_manager_class(request.args, self.schema)
+
+        obj, data = self._data_layer.get_relationship(
+            model_relationship_field, related_type_, related_id_field, kwargs, qs=qs,
+        )
 
         result = {
             "links": {
@@ -453,7 +477,14 @@ class ResourceRelationship(Resource):
             "data": data,
         }
 
-        qs = self.qs_manager_class(request.args, self.schema)
+        if qs.page_info is not None:
+            # a page of the linkage of a to-many relationship
+            pagination = {}
+            add_pagination_links(pagination, -1, qs, request.base_url)
+            result["links"].update(
+                (name, link) for name, link in pagination["links"].items() if name in ("first", "prev", "next")
+            )
+
         if qs.include:
             schema = compute_schema(self.schema, dict(), qs, qs.include)
 
@@ -585,14 +616,11 @@ class ResourceRelationship(Resource):
         """Get useful data for relationship management"""
         relationship_field = request.path.split("/")[-1].replace("-", "_")
 
-        if relationship_field not in get_relationships(self.schema):
+        relationship = get_resource_plan(self).relationships.get(relationship_field)
+        if relationship is None:
             raise RelationNotFound(f"{self.schema.__name__} has no attribute {relationship_field}")
 
-        related_type_ = self.schema._declared_fields[relationship_field].type_
-        related_id_field = self.schema._declared_fields[relationship_field].id_field
-        model_relationship_field = get_model_field(self.schema, relationship_field)
-
-        return relationship_field, model_relationship_field, related_type_, related_id_field
+        return relationship_field, relationship.attribute, relationship.type_, relationship.id_field
 
     def before_get(self, args, kwargs):
         """Hook to make custom work before get method"""
@@ -1,26 +1,73 @@
 """Helpers to deal with marshmallow schemas"""
 from collections import OrderedDict
+from functools import partial
+from threading import Lock
 
 from marshmallow import class_registry
 from marshmallow.base import SchemaABC
 from marshmallow_jsonapi.fields import Relationship, List, Nested
+from flask import g, has_app_context
 
+from flask_combo_jsonapi.cache import LRUCache
 from flask_combo_jsonapi.exceptions import InvalidInclude
 from flask_combo_jsonapi.utils import SPLIT_REL
 
+# idle computed schemas by signature, see compute_schema
+schema_cache = LRUCache(maxsize=256)
 
-def compute_schema(schema_cls, default_kwargs, qs, include):
+# guards the lists of idle schemas of schema_cache, a schema is checked out and in under it
+_pool_lock = Lock()
+
+
+def compute_schema(schema_cls, default_kwargs, qs, include, compiled=False):
     """Compute a schema around compound documents and sparse fieldsets
 
+    Computed schemas are pooled by signature (schema class, kwargs, include paths and sparse fieldsets). A schema
+    is checked out for the current request only and given back to the pool by :func:`release_schemas` at the end
+    of the request, so a schema is never used by two requests at the same time.
+
     :param Schema schema_cls: the schema class
     :param dict default_kwargs: the schema default kwargs
     :param QueryStringManager qs: qs
     :param list include: the relation field to include data from
+    :param bool compiled: whether the schema will be compiled by :func:`compile_serializer`, compiled schemas
+        are pooled apart from the other ones
 
     :return Schema schema: the schema computed
     """
-    # manage include_data parameter of the schema
-    schema_kwargs = default_kwargs
+    key = get_schema_cache_key(schema_cls, default_kwargs, qs, include)
+    if key is not None and compiled:
+        key += ('compiled',)
+    if key is not None:
+        schema = None
+        with _pool_lock:
+            idle = schema_cache.get(key)
+            if idle:
+                schema = idle.pop()
+        if schema is not None:
+            reset_schema(schema)
+            _check_out(schema, key)
+            return schema
+
+    schema = _compute_schema(schema_cls, default_kwargs, qs, include)
+    if key is not None:
+        _check_out(schema, key)
+
+    return schema
+
+
+def _compute_schema(schema_cls, default_kwargs, qs, include):
+    """Build a new schema around compound documents and sparse fieldsets
+
+    :param Schema schema_cls: the schema class
+    :param dict default_kwargs: the schema default kwargs
+    :param QueryStringManager qs: qs
+    :param list include: the relation field to include data from
+
+    :return Schema schema: the schema computed
+    """
+    # manage include_data parameter of the schema, default kwargs are shared by every request
+    schema_kwargs = dict(default_kwargs)
     schema_kwargs['include_data'] = schema_kwargs.get('include_data', tuple())
 
     # collect sub-related_includes
@@ -76,15 +123,132 @@ def compute_schema(schema_cls, default_kwargs, qs, include):
                 related_schema_cls = related_schema_cls.__class__
             if isinstance(related_schema_cls, str):
                 related_schema_cls = class_registry.get_class(related_schema_cls)
-            related_schema = compute_schema(related_schema_cls,
-                                            related_schema_kwargs,
-                                            qs,
-                                            related_includes[field] or None)
+            related_schema = _compute_schema(related_schema_cls,
+                                             related_schema_kwargs,
+                                             qs,
+                                             related_includes[field] or None)
             relation_field.__dict__['_Relationship__schema'] = related_schema
 
     return schema
 
 
+def get_schema_cache_key(schema_cls, default_kwargs, qs, include):
+    """Compute the signature of a computed schema
+
+    :param Schema schema_cls: the schema class
+    :param dict default_kwargs: the schema default kwargs
+    :param QueryStringManager qs: qs
+    :param list include: the relation field to include data from
+    :return tuple: the signature or None if the schema can't be pooled
+    """
+    if schema_cache.maxsize <= 0 or 'context' in default_kwargs:
+        # a context is request data and can't be shared
+        return None
+
+    kwargs = tuple(sorted(
+        (name, tuple(value) if isinstance(value, (list, set)) else value)
+        for name, value in default_kwargs.items()
+    ))
+    fields = tuple(sorted((type_, frozenset(fields)) for type_, fields in qs.fields.items()))
+    key = (schema_cls, kwargs, frozenset(include or ()), fields)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def reset_schema(schema):
+    """Reset the per dump and per load state of a computed schema and of its related schemas
+
+    :param Schema schema: a computed schema
+    """
+    schemas = [schema]
+    seen = set()
+    while schemas:
+        schema = schemas.pop()
+        if id(schema) in seen:
+            continue
+        seen.add(id(schema))
+        # assign new containers, documents already rendered may still reference the previous ones
+        schema.included_data = {}
+        schema.document_meta = {}
+        schema.context = {}
+        # the linkage attributes depend on the plan of the resource dumping the schema, see use_linkage_attributes
+        schema.__dict__.pop('_jsonapi_linkage_attributes', None)
+        for field in schema.declared_fields.values():
+            field.__dict__.pop('serialize', None)
+            related_schema = field.__dict__.get('_Relationship__schema')
+            if isinstance(related_schema, SchemaABC):
+                schemas.append(related_schema)
+
+
+def _check_out(schema, key):
+    """Mark a schema as used by the current request
+
+    :param Schema schema: a computed schema
+    :param tuple key: the signature of the schema
+    """
+    schema._jsonapi_cache_key = key
+    if has_app_context():
+        g.setdefault('_jsonapi_schemas', []).append(schema)
+
+
+def discard_schema(schema):
+    """Prevent a schema from being given back to the pool, for instance because a plugin altered it
+
+    :param Schema schema: a computed schema
+    """
+    schema.__dict__.pop('_jsonapi_cache_key', None)
+
+
+def release_schemas():
+    """Give back to the pool the schemas computed during the current request"""
+    if not has_app_context():
+        return
+    for schema in g.pop('_jsonapi_schemas', ()):
+        key = schema.__dict__.pop('_jsonapi_cache_key', None)
+        if key is None:
+            continue
+        with _pool_lock:
+            schema_cache.setdefault(key, []).append(schema)
+
+
+def use_linkage_attributes(schema, plan):
+    """Render the resource linkage of the many-to-one relationships of a computed schema, and of its included
+    schemas, from the foreign keys of the objects: dumping the schema doesn't load the related objects of the
+    relationships that are not included. The serialize method of the fields of the computed schema instance is
+    replaced, :func:`reset_schema` restores it when the schema is taken from the pool again.
+
+    :param Schema schema: a computed schema
+    :param ResourcePlan plan: the plan of the schema bound to its model
+    """
+    if schema.__dict__.get('_jsonapi_linkage_attributes'):
+        return
+    schema._jsonapi_linkage_attributes = True
+
+    for name, field in schema.fields.items():
+        relationship = plan.relationships.get(name)
+        if relationship is None:
+            continue
+        if field.include_data:
+            related_schema = field.__dict__.get('_Relationship__schema')
+            if isinstance(related_schema, SchemaABC) and relationship.related_model is not None:
+                use_linkage_attributes(related_schema, relationship.related_plan)
+        elif field.include_resource_linkage and relationship.linkage_attribute is not None:
+            field.serialize = partial(serialize_linkage_attribute, field, relationship.linkage_attribute)
+
+
+def serialize_linkage_attribute(field, linkage_attribute, attr, obj, accessor=None):
+    """Serialize a relationship with the id of the related object read from a foreign key of the object, see
+    :func:`use_linkage_attributes`
+    """
+    if isinstance(obj, dict):
+        return type(field).serialize(field, attr, obj, accessor)
+    related_id = getattr(obj, linkage_attribute)
+    return field._serialize(None if related_id is None else {field.id_field: related_id}, attr, obj)
+
+
 def get_model_field(schema, field):
     """Get the model field of a schema field
 
@@ -144,20 +308,57 @@ def get_related_schema(schema, field):
     return schema._declared_fields[field].schema
 
 
+# index of the schemas of marshmallow class registry by their type
+_schemas_by_type = {}
+_indexed_registry_size = None
+
+
+def index_schema_types():
+    """Build the index of the schemas of marshmallow class registry by their type"""
+    global _schemas_by_type, _indexed_registry_size
+
+    registry_size = len(class_registry._registry)
+    schemas_by_type = {}
+    for cls_name, cls in list(class_registry._registry.items()):
+        # only the full path entries, they are replaced when a class is registered again under the same name
+        if '.' not in cls_name:
+            continue
+        try:
+            schemas_by_type.setdefault(cls[0].opts.type_, cls[0])
+        except Exception:
+            pass
+
+    _schemas_by_type = schemas_by_type
+    _indexed_registry_size = registry_size
+
+
+def is_registered(schema):
+    """Check that a schema is still the class registered under its name in marshmallow class registry
+
+    :param Schema schema: a schema class
+    :return bool: False if another class has been registered under the same name since
+    """
+    registered = class_registry._registry.get('.'.join([schema.__module__, schema.__name__]))
+    return bool(registered) and registered[0] is schema
+
+
 def get_schema_from_type(resource_type):
     """Retrieve a schema from the registry by his type
 
     :param str type_: the type of the resource
     :return Schema: the schema class
     """
-    for cls_name, cls in class_registry._registry.items():
-        try:
-            if cls[0].opts.type_ == resource_type:
-                return cls[0]
-        except Exception:
-            pass
+    schema = _schemas_by_type.get(resource_type)
+    if (schema is None and _indexed_registry_size != len(class_registry._registry)) \
+            or (schema is not None and not is_registered(schema)):
+        # new schemas have been registered since the index was built
+        index_schema_types()
+        schema = _schemas_by_type.get(resource_type)
+
+    if schema is None:
+        raise Exception("Couldn't find schema for type: {}".format(resource_type))
 
-    raise Exception("Couldn't find schema for type: {}".format(resource_type))
+    return schema
 
 
 def get_schema_field(schema, field):
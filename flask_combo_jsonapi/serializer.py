@@ -0,0 +1,187 @@
+"""Code generated serializers of computed schemas.
+
+A compiled serializer builds the JSON:API document of a schema (``data``, ``attributes``, ``relationships``, ``meta``,
+``links`` and ``included``) directly from the objects, without going through the generic field dispatch and post
+dump processing of marshmallow and marshmallow_jsonapi for every row. Fields without a fast path are still serialized
+by marshmallow so the documents are identical to the ones of ``Schema.dump``.
+"""
+from marshmallow import fields as ma_fields, missing
+from marshmallow.base import SchemaABC
+from marshmallow_jsonapi.fields import BaseRelationship, DocumentMeta, ResourceMeta
+from marshmallow_jsonapi.schema import Schema as JSONAPISchema
+
+# methods of the schema inlined by the generated code, a schema overriding one of them is not compiled
+INLINED_METHODS = ('dump', '_serialize', 'format_json_api_response', 'format_items', 'format_item', 'get_attribute',
+                   'inflect', 'wrap_response', 'render_included_data', 'render_meta_document')
+
+# native type of the values returned by the fields having a fast path
+FAST_FIELDS = {
+    ma_fields.String: 'str',
+    ma_fields.Integer: 'int',
+    ma_fields.Float: 'float',
+    ma_fields.Boolean: 'bool',
+}
+
+
+def compile_serializer(schema):
+    """Replace the dump method of a computed schema and of its included related schemas by a serializer
+    generated for their fields. Schemas that can't be compiled keep the dump method of marshmallow.
+
+    :param Schema schema: a computed schema
+    :return bool: True if the schema is compiled
+    """
+    if 'dump' in schema.__dict__:
+        return True
+    if not can_compile(schema):
+        return False
+
+    source, namespace = generate_serializer(schema)
+    exec(compile(source, '<serializer of {}>'.format(type(schema).__name__), 'exec'), namespace)
+    schema.dump = namespace['dump']
+
+    for field in schema.declared_fields.values():
+        related_schema = field.__dict__.get('_Relationship__schema')
+        if getattr(field, 'include_data', False) and isinstance(related_schema, SchemaABC):
+            compile_serializer(related_schema)
+
+    return True
+
+
+def can_compile(schema):
+    """Check that the dump of a schema can be generated
+
+    :param Schema schema: a computed schema
+    :return bool: True if the schema can be compiled
+    """
+    if not isinstance(schema, JSONAPISchema):
+        return False
+    for name in INLINED_METHODS:
+        if getattr(type(schema), name) is not getattr(JSONAPISchema, name):
+            return False
+    for key, names in schema._hooks.items():
+        # keys are (tag, pass_many) or (tag, pass_many, pass_original) depending on the marshmallow version
+        if key[0] == 'pre_dump' and names:
+            return False
+        if key[0] == 'post_dump' and names and (key[1] is not True or names != ['format_json_api_response']):
+            return False
+
+    keys = [field.data_key if field.data_key is not None else name for name, field in schema.dump_fields.items()]
+    return len(keys) == len(set(keys))
+
+
+def generate_serializer(schema):
+    """Generate the source code of the dump method of a schema
+
+    :param Schema schema: a computed schema
+    :return tuple: the source code and the namespace to execute it in
+    """
+    namespace = {
+        'schema': schema,
+        'missing': missing,
+        'dict_class': schema.dict_class,
+        'get_attribute': schema.get_attribute,
+        'type_': schema.opts.type_,
+        'base_dump': JSONAPISchema.dump,
+    }
+    self_url = bool(schema.opts.self_url)
+
+    # same mapping of keys to fields as format_item
+    attributes = {(field.data_key or name): name for name, field in schema.fields.items()}
+
+    lines = [
+        'def format_item(obj):',
+        '    if hasattr(obj, "__getitem__"):',
+        '        return schema.format_item(schema._serialize(obj))',
+        '    ret = dict_class()',
+        '    ret["type"] = type_',
+        '    present = False',
+        '    attributes = relationships = None',
+    ]
+    if self_url:
+        lines.append('    item = dict_class()')
+
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        field_var = 'field_{}'.format(index)
+        namespace[field_var] = field
+        key = field.data_key if field.data_key is not None else name
+        attribute = field.attribute if field.attribute is not None else name
+        native = FAST_FIELDS.get(type(field))
+        if native is not None and field.dump_default is missing and field._CHECK_ATTRIBUTE and '.' not in attribute:
+            lines.append('    value = getattr(obj, {!r}, missing)'.format(attribute))
+            if getattr(field, 'as_string', False):
+                # Number._serialize with as_string
+                lines += [
+                    '    if value is not None and value is not missing:',
+                    '        value = str({}(value))'.format(native),
+                ]
+            else:
+                lines += [
+                    '    if value is not None and value is not missing and value.__class__ is not {}:'.format(native),
+                    '        value = {}._serialize(value, {!r}, obj)'.format(field_var, name),
+                ]
+        else:
+            lines.append('    value = {}.serialize({!r}, obj, accessor=get_attribute)'.format(field_var, name))
+
+        lines += [
+            '    if value is not missing:',
+            '        present = True',
+        ]
+        if self_url:
+            lines.append('        item[{!r}] = value'.format(key))
+
+        schema_field = schema.fields[attributes[key]]
+        if attributes[key] == 'id':
+            lines.append('        ret["id"] = value')
+        elif isinstance(schema_field, DocumentMeta):
+            lines += [
+                '        if not schema.document_meta:',
+                '            schema.document_meta = dict_class()',
+                '        schema.document_meta.update(value)',
+            ]
+        elif isinstance(schema_field, ResourceMeta):
+            lines += [
+                '        if "meta" not in ret:',
+                '            ret["meta"] = dict_class()',
+                '        ret["meta"].update(value)',
+            ]
+        elif isinstance(schema_field, BaseRelationship):
+            lines += [
+                '        if value:',
+                '            if relationships is None:',
+                '                relationships = ret["relationships"] = dict_class()',
+                '            relationships[{!r}] = value'.format(schema.inflect(key)),
+            ]
+        else:
+            lines += [
+                '        if attributes is None:',
+                '            attributes = ret["attributes"] = dict_class()',
+                '        attributes[{!r}] = value'.format(schema.inflect(key)),
+            ]
+
+    lines.append('    if not present:')
+    lines.append('        return None')
+    if self_url:
+        lines += [
+            '    links = schema.get_resource_links(item)',
+            '    if links:',
+            '        ret["links"] = links',
+        ]
+    lines += [
+        '    return ret',
+        '',
+        '',
+        'def dump(obj, *, many=None):',
+        '    many = schema.many if many is None else bool(many)',
+        '    if obj is None:',
+        '        return base_dump(schema, obj, many=many)',
+        '    if many:',
+        '        data = [format_item(each) for each in obj]',
+        '    else:',
+        '        data = format_item(obj)',
+        '    ret = schema.wrap_response(data, many)',
+        '    ret = schema.render_included_data(ret)',
+        '    return schema.render_meta_document(ret)',
+        '',
+    ]
+
+    return '\n'.join(lines), namespace
@@ -2,6 +2,22 @@ import simplejson as json
 from uuid import UUID
 from datetime import datetime
 
+try:
+    from functools import cached_property
+except ImportError:  # python < 3.8
+    class cached_property(object):
+        """Compute the value of a property once and store it in the instance dict"""
+
+        def __init__(self, func):
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __get__(self, instance, owner):
+            if instance is None:
+                return self
+            value = instance.__dict__[self.func.__name__] = self.func(instance)
+            return value
+
 
 """
 Splitter for filters, sorts and includes
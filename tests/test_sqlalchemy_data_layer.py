@@ -1,4 +1,4 @@
-from urllib.parse import urlencode, parse_qs
+from urllib.parse import urlencode, parse_qs, urlparse
 import pytest
 
 from sqlalchemy import create_engine, Column, Integer, DateTime, String, ForeignKey
@@ -8,7 +8,7 @@ from flask import Blueprint, make_response, json, request
 from marshmallow_jsonapi.flask import Schema, Relationship
 from marshmallow import Schema as MarshmallowSchema
 from marshmallow_jsonapi import fields
-from marshmallow import ValidationError
+from marshmallow import ValidationError, pre_dump
 from werkzeug.exceptions import Unauthorized
 
 from flask_combo_jsonapi import Api, ResourceList, ResourceDetail, ResourceRelationship, JsonApiException
@@ -2118,3 +2118,1339 @@ def test__sqlalchemy_data_layer__disable_collection_count(client,register_routes
     assert response.status_code == 200
     assert response.json
     assert response.json["meta"]["count"] == fixed_count_for_collection_count
+
+
+def test_resource_plan(register_routes, person_list, person_model, computer_model):
+    plan = person_list._plan
+    assert plan.schema is person_list.schema
+    assert plan.model is person_model
+    assert plan.id_field == "person_id"
+    assert plan.schema_to_model["id"] == "person_id"
+    assert plan.model_to_schema["person_id"] == "id"
+    assert set(plan.relationship_fields) == {"computers", "computers_owned", "address"}
+    assert set(plan.nested_model_fields) == {"tags", "single_tag"}
+    assert plan.relationships["computers"].related_model is computer_model
+    assert plan.relationships["computers"].related_plan.relationships["owner"].attribute == "person"
+    with pytest.raises(TypeError):
+        plan.relationships["error"] = None
+    with pytest.raises(AttributeError):
+        plan.id_field = "id"
+    with pytest.raises(AttributeError):
+        plan.relationships["computers"].many = False
+    assert isinstance(plan.relationship_fields, tuple) and isinstance(plan.join_fields_set, frozenset)
+
+
+def test_data_layer_post_init_called_once(app, client, register_routes, session, computer_model, computer_schema):
+    calls = []
+
+    class CountingDataLayer(SqlalchemyDataLayer):
+        def post_init(self):
+            calls.append("post_init")
+            super().post_init()
+
+        def init_request(self, resource):
+            calls.append("init_request")
+
+    class ComputerList(ResourceList):
+        disable_collection_count = True, 7
+        schema = computer_schema
+        data_layer = {"class": CountingDataLayer, "model": computer_model, "session": session}
+
+    assert ComputerList._data_layer.resource is ComputerList
+    assert ComputerList._data_layer.disable_collection_count is True
+    assert calls == ["post_init"]
+
+    api = Api(app)
+    api.route(ComputerList, "computer_list_post_init", "/computers_post_init")
+    for _ in range(3):
+        response = client.get("/computers_post_init", content_type="application/vnd.api+json")
+        assert response.status_code == 200
+        assert response.json["meta"]["count"] == 7
+    assert calls == ["post_init", "init_request", "init_request", "init_request"]
+
+
+def test_plugin_hooks_dispatch_table(app, client, register_routes, session, computer_model, computer_schema):
+    from flask_combo_jsonapi.plugin import BasePlugin, build_plugin_hooks
+
+    class QueryPlugin(BasePlugin):
+        def __init__(self):
+            self.calls = 0
+
+        def data_layer_get_collection_update_query(self, *args, query=None, **kwargs):
+            self.calls += 1
+            return query
+
+    class NotABasePlugin(object):
+        pass
+
+    plugin = QueryPlugin()
+    hooks = build_plugin_hooks([plugin, BasePlugin(), NotABasePlugin()])
+    assert list(hooks) == ["data_layer_get_collection_update_query"]
+    assert hooks["data_layer_get_collection_update_query"] == (plugin.data_layer_get_collection_update_query,)
+
+    class ComputerList(ResourceList):
+        schema = computer_schema
+        data_layer = {"model": computer_model, "session": session}
+
+    api = Api(app, plugins=[plugin, BasePlugin()])
+    api.route(ComputerList, "computer_list_plugins", "/computers_plugins")
+    response = client.get("/computers_plugins", content_type="application/vnd.api+json")
+    assert response.status_code == 200
+    assert plugin.calls == 1
+
+
+def test_query_string_manager_parsed_once(app, person_schema, monkeypatch):
+    with app.app_context():
+        qsm = QSManager(
+            {
+                "page[number]": "2",
+                "page[size]": "10",
+                "fields[person]": "name,birth_date",
+                "filter[name]": "test",
+                "sort": "-name",
+                "include": "computers",
+            },
+            person_schema,
+        )
+        calls = []
+        get_key_values = qsm._get_key_values
+        monkeypatch.setattr(qsm, "_get_key_values", lambda name: calls.append(name) or get_key_values(name))
+
+        assert dict(qsm.pagination) == {"number": 2, "size": 10}
+        assert qsm.pagination is qsm.pagination
+        assert dict(qsm.fields) == {"person": ("name", "birth_date")}
+        assert qsm.filters == ({"name": "name", "op": "eq", "val": "test"},)
+        assert qsm.filters is qsm.filters
+        assert qsm.sorting == ({"field": "name", "order": "desc"},)
+        assert qsm.include == ("computers",)
+        assert set(qsm.querystring) == {"page[number]", "page[size]", "fields[person]", "filter[name]", "sort",
+                                        "include"}
+        qsm.querystring
+        assert sorted(calls) == ["fields", "filter[", "filter[", "page"]
+
+        with pytest.raises(TypeError):
+            qsm.pagination["size"] = 0
+
+
+def test_filters_cache(client, register_routes, person, person_2, monkeypatch):
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filters_cache
+
+    filters_cache.clear()
+    loads = []
+    json_loads = flask_combo_jsonapi.querystring.json.loads
+    monkeypatch.setattr(flask_combo_jsonapi.querystring.json, "loads", lambda s: loads.append(s) or json_loads(s))
+    querystring = urlencode({
+        "filter": json.dumps([{"or": [{"name": "id", "op": "eq", "val": person.person_id},
+                                      {"not": {"name": "name", "op": "like", "val": "%"}}]}]),
+        "filter[name]": "test",
+    })
+    with client:
+        for _ in range(3):
+            response = client.get("/persons?" + querystring, content_type="application/vnd.api+json")
+            assert response.status_code == 200
+            assert [i["id"] for i in response.json["data"]] == [str(person.person_id)]
+    assert len(loads) == 1
+    assert filters_cache.info() == {"hits": 2, "misses": 1, "size": 1, "maxsize": 1024}
+
+    with client:
+        querystring = urlencode({"filter": json.dumps([{"name": "id", "op": "eq", "val": person_2.person_id}])})
+        response = client.get("/persons?" + querystring, content_type="application/vnd.api+json")
+        assert [i["id"] for i in response.json["data"]] == [str(person_2.person_id)]
+        # invalid filters are not cached
+        querystring = urlencode({"filter": json.dumps([{"name": "error", "op": "eq", "val": "1"}])})
+        response = client.get("/persons?" + querystring, content_type="application/vnd.api+json")
+        assert response.status_code == 400
+    assert len(filters_cache) == 2
+
+
+def test_lru_cache():
+    from flask_combo_jsonapi.cache import LRUCache
+
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 2, "maxsize": 2}
+    cache.resize(1)
+    assert list(cache._data) == ["c"]
+    cache.resize(0)
+    cache.set("d", 4)
+    assert len(cache) == 0
+
+
+def test_get_schema_from_type(register_routes, person_schema, computer_schema):
+    from flask_combo_jsonapi.schema import get_schema_from_type
+
+    assert get_schema_from_type("person") is person_schema
+    assert get_schema_from_type("computer") is computer_schema
+    with pytest.raises(Exception):
+        get_schema_from_type("not_registered_type")
+
+    class NotRegisteredYetSchema(Schema):
+        class Meta:
+            type_ = "not_registered_type"
+
+        id = fields.Str()
+
+    assert get_schema_from_type("not_registered_type") is NotRegisteredYetSchema
+
+    old_schema = NotRegisteredYetSchema
+
+    # registered again under the same name, with the same number of entries in the registry
+    class NotRegisteredYetSchema(Schema):
+        class Meta:
+            type_ = "not_registered_type"
+
+        id = fields.Str()
+
+    assert NotRegisteredYetSchema is not old_schema
+    assert get_schema_from_type("not_registered_type") is NotRegisteredYetSchema
+
+
+def test_schema_cache(session, client, register_routes, computer, person, person_2):
+    from flask_combo_jsonapi.schema import schema_cache
+
+    schema_cache.clear()
+    computer.person = person
+    session.commit()
+    with client:
+        responses = [
+            client.get("/computers/" + str(computer.id) + "?include=owner", content_type="application/vnd.api+json")
+            for _ in range(3)
+        ]
+        assert len({response.data for response in responses}) == 1
+        assert [item["id"] for item in responses[0].json["included"]] == [str(person.person_id)]
+    assert schema_cache.info()["hits"] == 2
+    assert len(schema_cache) == 1
+
+    # a reused schema doesn't keep the included data of a previous request
+    computer.person = person_2
+    session.commit()
+    with client:
+        response = client.get("/computers/" + str(computer.id) + "?include=owner", content_type="application/vnd.api+json")
+        assert [item["id"] for item in response.json["included"]] == [str(person_2.person_id)]
+        response = client.get("/computers/" + str(computer.id) + "?fields[computer]=serial",
+                              content_type="application/vnd.api+json")
+        assert "included" not in response.json
+        assert list(response.json["data"]["attributes"]) == ["serial"]
+    assert len(schema_cache) == 2
+
+
+def test_compiled_serializer(app, session, register_routes, person_schema, person, person_2, computer, address):
+    from flask_combo_jsonapi.schema import compute_schema
+    from flask_combo_jsonapi.serializer import compile_serializer
+
+    person.address = address
+    computer.person = person
+    session.commit()
+    persons = [person, person_2]
+    for query_string in ({"include": "computers,address"}, {"fields[person]": "name,computers"}, {}):
+        with app.test_request_context("/persons", query_string=query_string):
+            qs = QSManager(request.args, person_schema)
+            schema = compute_schema(person_schema, {"many": True}, qs, qs.include)
+            expected = json.dumps(schema.dump(persons))
+            schema = compute_schema(person_schema, {"many": True}, qs, qs.include, compiled=True)
+            assert compile_serializer(schema) is True
+            assert "dump" in schema.__dict__
+            assert json.dumps(schema.dump(persons)) == expected
+            assert json.dumps(schema.dump(person, many=False)) == json.dumps(
+                compute_schema(person_schema, {}, qs, qs.include).dump(person)
+            )
+
+    class PersonSchemaWithPreDump(person_schema):
+        class Meta:
+            type_ = "person"
+
+        @pre_dump
+        def noop(self, data, **kwargs):
+            return data
+
+    with app.test_request_context("/persons"):
+        schema = compute_schema(PersonSchemaWithPreDump, {}, QSManager({}, PersonSchemaWithPreDump), None)
+        assert compile_serializer(schema) is False
+        assert "dump" not in schema.__dict__
+
+
+@pytest.mark.parametrize("encoder", ["simplejson", "json", "ujson", "orjson"])
+def test_json_encoders(app, client, register_routes, person, encoder):
+    from datetime import datetime
+    from decimal import Decimal
+    from uuid import UUID
+    from flask_combo_jsonapi.encoders import get_encoder
+
+    if encoder in ("ujson", "orjson"):
+        pytest.importorskip(encoder)
+    app.config["JSON_ENCODER"] = encoder
+    with app.app_context():
+        document = get_encoder().dumps({
+            "date": datetime(2020, 1, 2, 3, 4, 5, 6),
+            "uuid": UUID("12345678123456781234567812345678"),
+            "decimal": Decimal("1.5"),
+        })
+    assert json.loads(document) == {
+        "date": "2020-01-02T03:04:05.000006",
+        "uuid": "12345678-1234-5678-1234-567812345678",
+        "decimal": 1.5 if encoder == "simplejson" else "1.5",
+    }
+
+    with client:
+        response = client.get("/persons/" + str(person.person_id), content_type="application/vnd.api+json")
+        assert response.status_code == 200
+        assert response.json["data"]["id"] == str(person.person_id)
+        response = client.get("/persons/0", content_type="application/vnd.api+json")
+        assert response.status_code == 404
+        assert response.json["errors"][0]["status"] == "404"
+        response = client.get("/persons", headers={"Accept": "application/vnd.api+json;q=0.8"})
+        assert response.status_code == 406
+
+
+def test_unknown_json_encoder(app):
+    from flask_combo_jsonapi.encoders import get_encoder
+
+    app.config["JSON_ENCODER"] = "unknown"
+    with app.app_context(), pytest.raises(ValueError):
+        get_encoder()
+    # the configuration is checked when the api is initialized
+    with pytest.raises(ValueError):
+        Api(app)
+
+
+def test_cursor_pagination(app, session, client, register_routes, persons, person, person_2, computer, computer_2):
+    app.config["SECRET_KEY"] = "secret"
+
+    def walk(url, querystring, direction="next"):
+        pages = []
+        if querystring:
+            url += "?" + urlencode(querystring)
+        response = client.get(url, content_type="application/vnd.api+json")
+        while True:
+            assert response.status_code == 200, response.json
+            pages.append([item["id"] for item in response.json["data"]])
+            link = response.json["links"].get(direction)
+            if link is None:
+                return pages, response.json["links"]
+            response = client.get(link, content_type="application/vnd.api+json")
+
+    ids = [p.person_id for p in persons]
+    querystring = {
+        "filter": json.dumps([{"name": "id", "op": "in_", "val": ids}]),
+        "sort": "-birth_date,name",
+        "include": "computers",
+        "page[cursor]": "",
+        "page[size]": 30,
+    }
+    with client:
+        pages, links = walk("/persons", querystring)
+        assert [len(page) for page in pages] == [30, 30, 30, 10]
+        assert sum(pages, []) == [str(p.person_id) for p in sorted(persons, key=lambda p: (p.name, p.person_id))]
+        assert "page%5Bcursor%5D=" in links["first"] and "last" not in links
+
+        # back to the first page
+        back_pages, links = walk(links["prev"], {}, direction="prev")
+        assert back_pages == pages[-2::-1]
+        assert "prev" not in links
+
+        # invalid or mismatching cursors
+        querystring["page[after]"] = "invalid"
+        querystring.pop("page[cursor]")
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 400
+        querystring["page[after]"] = back_pages[0]
+        querystring["page[number]"] = 2
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 400
+
+    # relationship sort and disabled count
+    computer.person, computer_2.person = person_2, person
+    person_2.name = "zzz"
+    session.commit()
+    with client:
+        pages, _ = walk("/computers_with_disabled_count", {
+            "filter": json.dumps([{"name": "id", "op": "in_", "val": [computer.id, computer_2.id]}]),
+            "sort": "-owner.name",
+            "page[cursor]": "",
+            "page[size]": 1,
+        })
+    assert pages == [[str(computer.id)], [str(computer_2.id)]]
+
+
+def test_cursor_pagination_configuration(app, session, client, register_routes, person_list, person_model,
+                                         person_schema, monkeypatch):
+    class PersonCursorList(ResourceList):
+        schema = person_schema
+        data_layer = {"model": person_model, "session": session, "cursor_pagination": True}
+
+    # a resource enabling cursors can't be routed without a key
+    with pytest.raises(ValueError):
+        Api(app).route(PersonCursorList, "person_cursor_list", "/persons_cursor")
+    api = Api()
+    api.route(PersonCursorList, "person_cursor_list", "/persons_cursor")
+    with pytest.raises(ValueError):
+        api.init_app(app)
+    app.config["CURSOR_SECRET_KEY"] = "secret"
+    Api(app).route(PersonCursorList, "person_cursor_list", "/persons_cursor")
+
+    response = client.get("/persons_cursor?page[cursor]=", content_type="application/vnd.api+json")
+    assert response.status_code == 200
+    monkeypatch.setattr(person_list._data_layer, "cursor_pagination", False, raising=False)
+    response = client.get("/persons?page[cursor]=", content_type="application/vnd.api+json")
+    assert response.status_code == 400
+    monkeypatch.undo()
+
+    # without a key cursors are not available
+    del app.config["CURSOR_SECRET_KEY"]
+    response = client.get("/persons?page[after]=x", content_type="application/vnd.api+json")
+    assert response.status_code == 400
+    assert response.json["errors"][0]["source"] == {"parameter": "page[after]"}
+
+
+def test_collection_count_modes(session, client, register_routes, person_list, person_model, persons, monkeypatch):
+    from sqlalchemy import text
+    from flask_combo_jsonapi.data_layers.alchemy import counts_cache
+
+    def get_count(querystring):
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return response.json["meta"]["count"]
+
+    session.execute(text("ANALYZE"))
+    session.commit()
+    with client:
+        total = get_count({})
+        assert get_count({"page[count]": "exact"}) == total
+        assert get_count({"page[count]": "none"}) == -1
+        assert get_count({"page[count]": "estimate"}) == total
+        # no statistics for filtered queries with sqlite: exact count
+        assert get_count({"page[count]": "estimate", "filter[name]": "test1"}) == 1
+        response = client.get("/persons?page[count]=all", content_type="application/vnd.api+json")
+        assert response.status_code == 400
+
+    counts_cache.clear()
+    monkeypatch.setattr(person_list._data_layer, "count_cache_ttl", 60, raising=False)
+    with client:
+        assert get_count({"filter[name]": "test1"}) == 1
+        other_person = person_model(name="test1")
+        session.add(other_person)
+        session.commit()
+        assert get_count({"filter[name]": "test1"}) == 1
+        assert get_count({"filter[name]": "test2"}) == 1
+        monkeypatch.setattr(person_list._data_layer, "count_mode", "none", raising=False)
+        assert get_count({"filter[name]": "test1"}) == -1
+        assert get_count({"filter[name]": "test1", "page[count]": "exact"}) == 1
+    assert counts_cache.info()["hits"] == 2
+    counts_cache.clear()
+    session.delete(other_person)
+    session.commit()
+
+
+def test_estimated_count_explain(engine, session, client, register_routes, person_model, persons, monkeypatch):
+    from sqlalchemy import event, select
+    from sqlalchemy.dialects import postgresql
+    from flask_combo_jsonapi.data_layers.alchemy import Explain
+
+    statement = select(person_model).where(person_model.person_id.in_([1, 2]))
+    compiled = Explain(statement).compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "POSTCOMPILE" in str(compiled)
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    ids = [p.person_id for p in persons]
+    querystring = {"page[count]": "estimate", "filter": json.dumps([{"name": "id", "op": "in_", "val": ids}])}
+    # the EXPLAIN fails with sqlite, the exact count is used instead
+    monkeypatch.setattr(engine.dialect, "name", "postgresql")
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200, response.json
+    assert response.json["meta"]["count"] == len(ids)
+    explain = [statement for statement in statements if statement.startswith("EXPLAIN")]
+    assert len(explain) == 1
+    assert "POSTCOMPILE" not in explain[0]
+
+
+def test_window_count_strategy(engine, session, client, register_routes, person_list, person_schema, persons, computer,
+                               computer_model, monkeypatch):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filters_cache
+
+    computer.person = persons[0]
+    session.commit()
+    ids = [p.person_id for p in persons]
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def get(querystring):
+        del statements[:]
+        querystring["filter"] = json.dumps([{"name": "id", "op": "in_", "val": ids}])
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return response.json
+
+    with client:
+        expected = [get({"page[number]": number, "include": "computers"}) for number in (1, 4, 5)]
+
+    monkeypatch.setattr(person_list._data_layer, "count_strategy", "window", raising=False)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            for number, result in zip((1, 4, 5), expected):
+                assert get({"page[number]": number, "include": "computers"}) == result
+                assert result["meta"]["count"] == 100
+                # one query for the page and the count, another one to count when the page is empty
+                counts = [statement for statement in statements if "count(*)" in statement]
+                assert len(counts) == (1 if number < 5 else 2)
+                assert "count(*) OVER ()" in counts[0]
+            assert get({"page[size]": 0})["meta"]["count"] == 100
+            assert not [statement for statement in statements if "count(*)" in statement]
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    # a joined to-many relationship multiplies the rows, the objects are counted by the count statement
+    owners = persons[:3]
+    probes = [computer_model(serial=f"probe {i}", person=owners[i % 3]) for i in range(9)]
+    session.add_all(probes)
+    session.commit()
+    filters_cache.clear()
+    monkeypatch.setitem(person_schema._declared_fields["computers"].metadata, "filter_strategy", "join")
+    try:
+        with client:
+            querystring = urlencode({"filter": json.dumps([{"name": "computers.serial", "op": "like",
+                                                            "val": "probe%"}])})
+            response = client.get("/persons?" + querystring, content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            assert response.json["meta"]["count"] == 3
+    finally:
+        monkeypatch.undo()
+        filters_cache.clear()
+        for probe in probes:
+            session.delete(probe)
+        session.commit()
+
+
+def test_has_more_pagination(client, register_routes, persons):
+    ids = [p.person_id for p in persons]
+
+    def get(querystring):
+        querystring["filter"] = json.dumps([{"name": "id", "op": "in_", "val": ids}])
+        querystring["page[size]"] = 30
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return response.json
+
+    with client:
+        for number in (1, 2, 4):
+            counted = get({"page[number]": number})
+            result = get({"page[number]": number, "page[count]": "none"})
+            assert result["data"] == counted["data"]
+            assert result["meta"]["count"] == -1
+            assert "last" in counted["links"] and "last" not in result["links"]
+            for name in ("first", "prev", "next"):
+                link, counted_link = result["links"].get(name), counted["links"].get(name)
+                assert (link is None) == (counted_link is None)
+                if link is not None:
+                    args = parse_qs(urlparse(link).query)
+                    assert args.pop("page[count]") == ["none"]
+                    assert args == parse_qs(urlparse(counted_link).query)
+        assert "next" in get({"page[number]": 3, "page[count]": "none"})["links"]
+        assert len(get({"page[number]": 4, "page[count]": "none"})["data"]) == 10
+
+        response = client.get("/persons?" + urlencode({
+            "filter": json.dumps([{"name": "id", "op": "in_", "val": ids[:3]}]),
+            "page[count]": "none",
+            "page[size]": 3,
+        }), content_type="application/vnd.api+json")
+        assert len(response.json["data"]) == 3
+        assert set(response.json["links"]) == {"self"}
+
+
+def test_count_statement(engine, session, client, register_routes, person_list, person_model, person_schema, persons,
+                         monkeypatch):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filters_cache
+
+    ids = [p.person_id for p in persons]
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if "count(" in statement:
+            statements.append(" ".join(statement.split()))
+
+    def count(filters, **querystring):
+        del statements[:]
+        querystring["filter"] = json.dumps([{"name": "id", "op": "in_", "val": ids}] + filters)
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        assert len(statements) == 1
+        return statements[0], response.json["meta"]["count"]
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            statement, total = count([], sort="-name", include="computers")
+            assert total == 100
+            assert statement.startswith("SELECT count(*) AS count_1 FROM person WHERE")
+            assert "ORDER BY" not in statement and "JOIN" not in statement
+
+            # to-one join
+            statement, _ = count([{"name": "address.city", "op": "eq", "val": "Paris"}], sort="name")
+            assert statement.startswith("SELECT count(*) AS count_1 FROM person JOIN address")
+            assert "ORDER BY" not in statement
+
+            # to-many relationships are filtered with EXISTS
+            statement, _ = count([{"name": "computers.serial", "op": "eq", "val": "Amstrad"}])
+            assert statement.startswith("SELECT count(*) AS count_1 FROM person WHERE")
+            assert "JOIN" not in statement and "EXISTS" in statement
+
+            # to-many join
+            filters_cache.clear()
+            monkeypatch.setitem(person_schema._declared_fields["computers"].metadata, "filter_strategy", "join")
+            statement, _ = count([{"name": "computers.serial", "op": "eq", "val": "Amstrad"}])
+            assert statement.startswith("SELECT count(DISTINCT person.person_id) AS count_1 FROM person JOIN computer")
+            monkeypatch.undo()
+            filters_cache.clear()
+
+        # queries that don't select the model alone are counted from a subquery
+        def query(view_kwargs):
+            return session.query(person_model).distinct()
+
+        monkeypatch.setattr(person_list._data_layer, "query", query, raising=False)
+        with client:
+            statement, total = count([])
+            assert total == 100
+            assert statement.startswith("SELECT count(*) AS count_1 FROM (SELECT DISTINCT")
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_deferred_join_pagination(engine, session, client, register_routes, person_list, persons, computer,
+                                  monkeypatch):
+    from sqlalchemy import event
+
+    computer.person = persons[84]
+    session.commit()
+    ids = [p.person_id for p in persons]
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    def get(querystring):
+        querystring["filter"] = json.dumps([{"name": "id", "op": "in_", "val": ids}])
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return response.json
+
+    querystrings = [
+        {"page[number]": 3, "page[size]": 7, "sort": "-name", "include": "computers"},
+        {"page[number]": 2, "page[size]": 3, "sort": "name"},
+        {"page[number]": 15, "page[size]": 7, "page[count]": "none", "sort": "-name"},
+    ]
+    with client:
+        expected = [get(dict(querystring)) for querystring in querystrings]
+
+    monkeypatch.setattr(person_list._data_layer, "pagination_strategy", "deferred_join", raising=False)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            for querystring, result in zip(querystrings, expected):
+                del statements[:]
+                assert get(dict(querystring)) == result
+                assert any("JOIN (SELECT person.person_id AS person_id FROM person" in statement
+                           for statement in statements)
+            assert expected[0]["included"][0]["id"] == str(computer.id)
+            assert "next" not in expected[2]["links"]
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_deferred_join_to_many(engine, session, client, register_routes, person_list, person_schema, persons,
+                               computer_model, monkeypatch):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filters_cache
+
+    computers = [computer_model(serial=f"deferred {i}", person=persons[i // 2]) for i in range(5)]
+    session.add_all(computers)
+    session.commit()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    def get_pages():
+        pages = []
+        for number in range(1, 5):
+            querystring = {
+                "filter": json.dumps([{"name": "computers.serial", "op": "like", "val": "deferred%"}]),
+                "sort": "name",
+                "page[number]": number,
+                "page[size]": 2,
+            }
+            response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            pages.append([item["id"] for item in response.json["data"]])
+        return pages
+
+    filters_cache.clear()
+    monkeypatch.setitem(person_schema._declared_fields["computers"].metadata, "filter_strategy", "join")
+    try:
+        with client:
+            expected = get_pages()
+        monkeypatch.setattr(person_list._data_layer, "pagination_strategy", "deferred_join", raising=False)
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            with client:
+                assert get_pages() == expected
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        # the to-many join may return a person on several rows, the pages are read with LIMIT and OFFSET
+        assert not any("JOIN (SELECT person.person_id" in statement for statement in statements)
+    finally:
+        monkeypatch.undo()
+        filters_cache.clear()
+        for computer_ in computers:
+            session.delete(computer_)
+        session.commit()
+
+
+def test_include_loaders(engine, session, client, register_routes, person_list, person_model, computer_model, persons,
+                         computer, monkeypatch):
+    from marshmallow_jsonapi.fields import Relationship
+    from sqlalchemy import event
+    from sqlalchemy.exc import InvalidRequestError
+    from flask_combo_jsonapi.plan import RelationshipPlan
+
+    computer.person = persons[0]
+    session.commit()
+    plan = person_list._plan
+    assert plan.relationships["computers"].loader == "selectin"
+    assert plan.relationships["address"].loader == "joined"
+    assert plan.relationships["computers"].related_plan.relationships["owner"].loader == "joined"
+    field = Relationship(type_="computer", many=True, metadata={"loader": "subquery"})
+    assert RelationshipPlan("computers", field, "computers", person_model).loader == "subquery"
+    with pytest.raises(ValueError):
+        RelationshipPlan("computers", Relationship(type_="computer", metadata={"loader": "lazy"}), "computers",
+                         person_model).loader
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    def get(querystring):
+        del statements[:]
+        querystring["filter"] = json.dumps([{"name": "id", "op": "in_", "val": [persons[0].person_id]}])
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return response.json
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            expected = get({"include": "computers.owner"})
+            assert expected["included"]
+            page_query, = [statement for statement in statements if "FROM person" in statement and "LIMIT" in statement]
+            assert "JOIN computer" not in page_query
+            assert any(statement.startswith("SELECT computer.") and " IN (" in statement for statement in statements)
+
+            monkeypatch.setattr(person_list._data_layer, "include_loaders", {"computers": "joined"}, raising=False)
+            assert get({"include": "computers.owner"}) == expected
+            assert any("LEFT OUTER JOIN computer" in statement for statement in statements)
+            monkeypatch.undo()
+
+            monkeypatch.setattr(person_list._data_layer, "strict_loading", True, raising=False)
+            assert get({"include": "computers.owner"}) == expected
+            get({})
+            with pytest.raises(InvalidRequestError):
+                session.query(person_model).get(persons[0].person_id).computers
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        monkeypatch.undo()
+        session.expire_all()
+        session.query(person_model).populate_existing().all()
+
+
+def test_load_only_fields(engine, session, client, register_routes, person_list, person_model, persons, computer,
+                          monkeypatch):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.data_layers.alchemy import compute_load_only_attributes
+    from flask_combo_jsonapi.plan import get_plan
+
+    computer.person = persons[0]
+    session.commit()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    def get(url, querystring):
+        del statements[:]
+        response = client.get(url + "?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return response.json
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            result = get(f"/persons/{persons[0].person_id}", {
+                "include": "computers",
+                "fields[person]": "name,computers",
+                "fields[computer]": "owner",
+            })
+            assert result["data"]["attributes"] == {"name": persons[0].name}
+            owner_link = result["included"][0]["relationships"]["owner"]["links"]["related"]
+            assert owner_link.endswith(f"/persons/{persons[0].person_id}")
+            person_query, computer_query = [statement for statement in statements if statement.startswith("SELECT")][:2]
+            assert "person.name" in person_query and "person.birth_date" not in person_query
+            assert "computer.person_id" in computer_query and "computer.serial" not in computer_query
+
+            result = get("/persons", {"fields[person]": "birth_date", "page[size]": 5})
+            assert set(result["data"][0]["attributes"]) == {"birth_date"}
+            assert "person.name" not in statements[-1] and "person.birth_date" in statements[-1]
+
+            monkeypatch.setattr(person_list._data_layer, "load_only_fields", False, raising=False)
+            get("/persons", {"fields[person]": "birth_date", "page[size]": 5})
+            assert "person.name" in statements[-1]
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    class PersonSchema(MarshmallowSchema):
+        id = fields.Integer(attribute="person_id")
+        name = fields.Str()
+        display_name = fields.Function(lambda obj: obj.name.upper())
+        short_name = fields.Function(lambda obj: obj.name[:3], metadata={"depends_on": ["name"]})
+
+    plan = get_plan(PersonSchema, person_model)
+    assert compute_load_only_attributes(plan, ["id"]) == ("person_id",)
+    assert compute_load_only_attributes(plan, ["short_name"]) == ("name", "person_id")
+    assert compute_load_only_attributes(plan, ["name", "display_name"]) is None
+
+
+def test_linkage_from_foreign_keys(app, engine, session, client, register_routes, computer_schema, computer_model,
+                                   person_model, persons):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.plan import get_plan
+
+    class ComputerLinkageSchema(computer_schema):
+        class Meta:
+            type_ = "computer"
+            self_view = "api.computer_detail"
+            self_view_kwargs = {"id": "<id>"}
+
+        owner = Relationship(
+            attribute="person",
+            related_view="api.person_detail",
+            related_view_kwargs={"person_id": "<person_id>"},
+            schema="PersonSchema",
+            id_field="person_id",
+            type_="person",
+            include_resource_linkage=True,
+        )
+
+    class ComputerLinkageList(ResourceList):
+        schema = ComputerLinkageSchema
+        data_layer = {"model": computer_model, "session": session}
+
+    api = Api(app)
+    api.route(ComputerLinkageList, "computer_linkage_list", "/computers_linkage")
+    assert get_plan(ComputerLinkageSchema, computer_model).relationships["owner"].linkage_attribute == "person_id"
+    assert get_plan(ComputerLinkageSchema, person_model).relationships["owner"].linkage_attribute is None
+
+    computers = [computer_model(serial=f"linkage {i}", person=persons[i] if i else None) for i in range(5)]
+    session.add_all(computers)
+    session.commit()
+    ids = [computer_.id for computer_ in computers]
+    expected = {str(ids[0]): None}
+    expected.update({str(ids[i]): {"type": "person", "id": str(persons[i].person_id)} for i in range(1, 5)})
+    session.expire_all()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            for fast_serializer in (False, True):
+                del statements[:]
+                ComputerLinkageList.fast_serializer = fast_serializer
+                response = client.get("/computers_linkage?" + urlencode({
+                    "filter": json.dumps([{"name": "id", "op": "in_", "val": ids}]),
+                    "page[count]": "none",
+                }), content_type="application/vnd.api+json")
+                assert response.status_code == 200, response.json
+                linkage = {item["id"]: item["relationships"]["owner"]["data"] for item in response.json["data"]}
+                assert linkage == expected
+                assert len(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        for computer_ in computers:
+            session.delete(computer_)
+        session.commit()
+
+    # a pooled schema doesn't keep the linkage attributes of the plan of the previous resource
+    from flask_combo_jsonapi.querystring import QueryStringManager
+    from flask_combo_jsonapi.schema import compute_schema, release_schemas, use_linkage_attributes
+
+    with app.test_request_context():
+        qs = QueryStringManager({}, ComputerLinkageSchema)
+        schema = compute_schema(ComputerLinkageSchema, {}, qs, [])
+        use_linkage_attributes(schema, get_plan(ComputerLinkageSchema, computer_model))
+        assert "serialize" in schema.fields["owner"].__dict__
+        release_schemas()
+        pooled = compute_schema(ComputerLinkageSchema, {}, qs, [])
+        assert pooled is schema
+        assert "serialize" not in pooled.fields["owner"].__dict__
+        use_linkage_attributes(pooled, get_plan(ComputerLinkageSchema, person_model))
+        assert "serialize" not in pooled.fields["owner"].__dict__
+
+
+def test_get_relationship_ids(engine, session, client, register_routes, person, computer_model, monkeypatch):
+    from sqlalchemy import event
+
+    computers = [computer_model(serial=f"relationship {i}", person=person) for i in range(3)]
+    session.add_all(computers)
+    session.commit()
+    ids = sorted(computer_.id for computer_ in computers)
+    person_id = person.person_id
+    url = f"/persons/{person_id}/relationships/computers"
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            response = client.get(url, content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            assert response.json["data"] == [{"type": "computer", "id": id_} for id_ in ids]
+            assert set(response.json["links"]) == {"self", "related"}
+            assert len(statements) == 2
+            assert statements[1].startswith("SELECT computer.id AS computer_id FROM computer WHERE")
+
+            response = client.get(url + "?page[size]=2", content_type="application/vnd.api+json")
+            assert response.json["data"] == [{"type": "computer", "id": id_} for id_ in ids[:2]]
+            assert parse_qs(urlparse(response.json["links"]["next"]).query)["page[number]"] == ["2"]
+            assert "prev" not in response.json["links"]
+
+            response = client.get(url + "?page[size]=2&page[number]=2", content_type="application/vnd.api+json")
+            assert response.json["data"] == [{"type": "computer", "id": ids[2]}]
+            assert "next" not in response.json["links"] and "prev" in response.json["links"]
+
+            # the parsed pagination decides: a page number alone asks for a page of the default size
+            response = client.get(url + "?page[number]=2", content_type="application/vnd.api+json")
+            assert response.json["data"] == []
+            assert "prev" in response.json["links"] and "next" not in response.json["links"]
+            response = client.get(url + "?page[size]=0&page[number]=2", content_type="application/vnd.api+json")
+            assert len(response.json["data"]) == 3 and "first" not in response.json["links"]
+            # an explicit page size equal to the default one is a page too
+            monkeypatch.setitem(client.application.config, "PAGE_SIZE", 2)
+            response = client.get(url + "?page[size]=2", content_type="application/vnd.api+json")
+            assert response.json["data"] == [{"type": "computer", "id": id_} for id_ in ids[:2]]
+            assert "next" in response.json["links"]
+            response = client.get(url, content_type="application/vnd.api+json")
+            assert len(response.json["data"]) == 3
+
+            del statements[:]
+            response = client.get(f"/computers/{ids[0]}/relationships/owner", content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            assert response.json["data"] == {"type": "person", "id": person_id}
+            # the id is read from the foreign key, the person is only loaded for the related link
+            assert len(statements) == 2
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        for computer_ in computers:
+            session.delete(computer_)
+        session.commit()
+
+
+def test_get_related_objects(engine, session, client, register_routes, person, computer_model):
+    from sqlalchemy import event
+
+    computers = [computer_model(serial=f"batch {i}") for i in range(3)]
+    session.add_all(computers)
+    session.commit()
+    ids = [computer_.id for computer_ in computers]
+    url = f"/persons/{person.person_id}/relationships/computers"
+    session.expire_all()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            payload = {"data": [{"type": "computer", "id": str(id_)} for id_ in ids]}
+            response = client.post(url, data=json.dumps(payload), content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            computer_selects = [statement for statement in statements if statement.startswith("SELECT computer.")]
+            # the computers already loaded in the session come from the identity map, the others from one query
+            assert len([statement for statement in computer_selects if " IN (" in statement]) == 1
+
+            payload = {"data": [{"type": "computer", "id": str(ids[0])}, {"type": "computer", "id": "9999"},
+                                {"type": "computer", "id": "9998"}]}
+            response = client.patch(url, data=json.dumps(payload), content_type="application/vnd.api+json")
+            assert response.status_code == 404
+            assert response.json["errors"][0]["detail"] == "Computer.id: 9999, 9998 not found"
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        session.rollback()
+        for computer_ in computers:
+            session.delete(computer_)
+        session.commit()
+
+
+def test_overrides(session, person_model):
+    from flask_combo_jsonapi.data_layers.alchemy import SqlalchemyDataLayer, overrides
+
+    def get_object(self, related_model, related_id_field, obj):
+        return None
+
+    class DataLayer(SqlalchemyDataLayer):
+        get_related_object = get_object
+
+    class ChildDataLayer(DataLayer):
+        pass
+
+    assert not overrides(SqlalchemyDataLayer(dict(session=session, model=person_model)), "get_related_object")
+    assert overrides(ChildDataLayer(dict(session=session, model=person_model)), "get_related_object")
+    data_layer = SqlalchemyDataLayer(
+        dict(session=session, model=person_model, methods={"after_get_relationship": lambda self, *args: None})
+    )
+    assert overrides(data_layer, "after_get_relationship")
+    assert not overrides(data_layer, "get_related_object")
+
+
+def test_join_registry(engine, session, client, register_routes, person, person_2, computer_model, person_schema,
+                       monkeypatch):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filters_cache
+
+    computers = [computer_model(serial="joined 1", person=person), computer_model(serial="joined 2", person=person_2),
+                 computer_model(serial="joined 3")]
+    session.add_all(computers)
+    session.commit()
+    expected = [str(computers[0].id), str(computers[1].id)]
+    names = sorted([person.name, person_2.name])
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            filters = [
+                {"name": "serial", "op": "like", "val": "joined%"},
+                {"or": [{"name": "owner.name", "op": "eq", "val": names[0]},
+                        {"name": "owner.name", "op": "eq", "val": names[1]}]},
+                {"not": {"name": "owner.name", "op": "eq", "val": "unknown"}},
+            ]
+            querystring = urlencode({"filter": json.dumps(filters), "sort": "owner.name"})
+            response = client.get("/computers_with_disabled_count?" + querystring,
+                                  content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            assert sorted(item["id"] for item in response.json["data"]) == sorted(expected)
+            page_query = [statement for statement in statements if statement.startswith("SELECT computer.")][-1]
+            assert page_query.count("JOIN person") == 1
+
+            # to-many relationships joined instead of filtered with EXISTS keep a join by node
+            filters_cache.clear()
+            monkeypatch.setitem(person_schema._declared_fields["computers"].metadata, "filter_strategy", "join")
+            del statements[:]
+            filters = [{"name": "computers.serial", "op": "eq", "val": "joined 1"},
+                       {"name": "computers.serial", "op": "eq", "val": "joined 2"}]
+            response = client.get("/persons?" + urlencode({"filter": json.dumps(filters)}),
+                                  content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            assert response.json["data"] == []
+            assert statements[-1].count("JOIN computer") == 2
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        monkeypatch.undo()
+        filters_cache.clear()
+        for computer_ in computers:
+            session.delete(computer_)
+        session.commit()
+
+
+def test_exists_filters(engine, session, client, register_routes, person, person_2, person_model, computer_model):
+    from sqlalchemy import event
+
+    person_3 = person_model(name="test3")
+    computers = [computer_model(serial="exists 1", person=person), computer_model(serial="exists 2", person=person),
+                 computer_model(serial="exists 3", person=person_2)]
+    session.add_all(computers + [person_3])
+    session.commit()
+    ids = {name: str(p.person_id) for name, p in (("first", person), ("second", person_2), ("third", person_3))}
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(" ".join(statement.split()))
+
+    def get(filter_, **querystring):
+        del statements[:]
+        querystring["filter"] = json.dumps([{"name": "id", "op": "in_", "val": list(ids.values())}, filter_])
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        assert not any("DISTINCT" in statement or "JOIN computer" in statement for statement in statements)
+        return sorted(item["id"] for item in response.json["data"]), response.json["meta"]["count"]
+
+    def serial(value):
+        return {"name": "computers.serial", "op": "eq", "val": value}
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            assert get(serial("exists 1")) == ([ids["first"]], 1)
+            assert get({"or": [serial("exists 1"), serial("exists 2")]}) == ([ids["first"]], 1)
+            assert get({"and": [serial("exists 1"), serial("exists 2")]}) == ([ids["first"]], 1)
+            assert get({"and": [serial("exists 1"), serial("exists 3")]}) == ([], 0)
+            assert get({"not": serial("exists 1")}) == (sorted([ids["second"], ids["third"]]), 2)
+            assert get({"not": {"or": [serial("exists 1"), serial("exists 3")]}}) == ([ids["third"]], 1)
+            named_test = {"name": "name", "op": "eq", "val": "test"}
+            assert get({"or": [{"not": serial("exists 1")}, {"and": [serial("exists 2"), named_test]}]}) \
+                == (sorted(ids.values()), 3)
+            # a relationship of the related objects is filtered in the EXISTS subquery
+            assert get({"name": "computers.owner.name", "op": "eq", "val": "test2"}) == ([ids["second"]], 1)
+            assert get({"name": "computers", "op": "any", "val": {"name": "serial", "op": "like", "val": "exists%"}},
+                       **{"page[size]": 1, "sort": "name"}) == ([ids["first"]], 2)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        for computer_ in computers:
+            session.delete(computer_)
+        session.delete(person_3)
+        session.commit()
+
+
+def test_field_operators(register_routes, person_list, person_schema, person_model, monkeypatch):
+    from marshmallow import fields as ma_fields
+    from flask_combo_jsonapi.data_layers.filtering import alchemy as filtering
+    from flask_combo_jsonapi.plan import get_plan
+
+    # bound to the columns when the plan of the resource is compiled
+    operators = person_list._plan.field_operators["name"]
+    assert operators.column is person_model.name
+    assert operators.operators["in_"] == "in_" and operators.operators["eq"] == "__eq__"
+    assert operators.method("in_", person_model.name) == person_model.name.in_
+    assert "computers" in person_list._plan.field_operators
+
+    class UpperString(ma_fields.String):
+        def _upper_sql_filter_(self, marshmallow_field, model_column, value, operator):
+            return model_column == value.upper()
+
+    class UpperSchema(Schema):
+        class Meta:
+            type_ = "person"
+
+        id = fields.Integer(as_string=True, attribute="person_id")
+        name = UpperString()
+
+    operators = get_plan(UpperSchema, person_model).field_operators["name"]
+    assert set(operators.sql_filters) == {"upper"}
+    assert operators.operator("in", person_model.name) == "in_"
+    assert "in" not in operators.operators
+    with pytest.raises(InvalidFilters):
+        operators.operator("unknown", person_model.name)
+
+    node = filtering.Node(person_model, {"name": "name", "op": "upper", "val": "john"}, None, UpperSchema)
+    filter_, joins = node.resolve()
+    assert str(filter_.compile(compile_kwargs={"literal_binds": True})) == "person.name = 'JOHN'"
+
+    # the properties of a node are computed once
+    calls = []
+    get_model_field = filtering.get_model_field
+    monkeypatch.setattr(filtering, "get_model_field", lambda *args: calls.append(args) or get_model_field(*args))
+    node = filtering.Node(person_model, {"name": "name", "op": "in", "val": ["a", "b"]}, None, person_schema)
+    node.resolve()
+    assert node.operator == "in_" and len(calls) == 1
+
+
+def test_large_in_list(engine, client, register_routes, person_list, person_model, person, person_2, monkeypatch):
+    from sqlalchemy import event
+    from uuid import UUID
+    from sqlalchemy.dialects import postgresql
+    from marshmallow import fields as ma_fields
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filter_operator
+    from flask_combo_jsonapi.data_layers.shared import JoinRegistry, deserialize_values
+
+    assert deserialize_values(ma_fields.Integer(), ["1", 2, "1", "2", 3]) == [1, 2, 3]
+    assert deserialize_values(ma_fields.String(), ["a", "b", "a"]) == ["a", "b"]
+    with pytest.raises(InvalidFilters):
+        deserialize_values(ma_fields.Integer(), ["1", "x"])
+
+    # one array parameter with PostgreSQL
+    registry = JoinRegistry(dialect="postgresql", large_in_list=2)
+    for operator, sql in (("in_", "person.name = ANY (%(param_1)s::VARCHAR[])"),
+                          ("notin_", "person.name != ALL (%(param_1)s::VARCHAR[])")):
+        filter_ = filter_operator(person_model.name, operator, ["a", "b", "c"], registry)
+        compiled = filter_.compile(dialect=postgresql.dialect())
+        assert str(compiled) == sql
+        assert compiled.params == {"param_1": ["a", "b", "c"]}
+
+    # values json can't represent are split in lists with SQLite
+    registry = JoinRegistry(dialect="sqlite", large_in_list=2)
+    filter_ = filter_operator(person_model.name, "in_", [UUID(int=i) for i in range(3)], registry)
+    assert str(filter_).count("person.name IN (") == 2
+
+    monkeypatch.setattr(person_list._data_layer, "large_in_list", 100, raising=False)
+    ids = [str(person.person_id), str(person_2.person_id)]
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    def get(filters, **querystring):
+        del statements[:]
+        querystring["filter"] = json.dumps(filters)
+        response = client.get("/persons?" + urlencode(querystring), content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        statement, parameters = next(item for item in statements if item[0].startswith("SELECT person."))
+        return response.json, statement, parameters
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            values = [str(i) for i in range(100000, 100250)] + ids + ids
+            result, statement, parameters = get([{"name": "id", "op": "in_", "val": values}], sort="name")
+            assert [item["id"] for item in result["data"]] == ids
+            assert result["meta"]["count"] == 2
+            # the values are one json parameter with sqlite
+            assert "json_each(?)" in statement
+            assert len(parameters) < 10
+
+            names = [f"name {i}" for i in range(250)] + ["test", "test2"]
+            result, statement, parameters = get([{"name": "name", "op": "in_", "val": names},
+                                                 {"name": "id", "op": "in_", "val": ids}])
+            assert sorted(item["id"] for item in result["data"]) == sorted(ids)
+            assert "person.name IN (SELECT" in statement
+            assert len(parameters) < 10
+            result, _, _ = get([{"name": "name", "op": "notin_", "val": names},
+                                {"name": "id", "op": "in_", "val": ids}])
+            assert result["data"] == []
+
+            # other columns are split in lists of large_in_list values
+            dates = [f"2000-01-01T00:{i // 60:02}:{i % 60:02}" for i in range(250)]
+            result, statement, parameters = get([{"name": "birth_date", "op": "in_", "val": dates},
+                                                 {"name": "id", "op": "in_", "val": ids}])
+            assert statement.count("person.birth_date IN (") == 3
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    monkeypatch.setattr(person_list._data_layer, "large_in_list", 0, raising=False)
+    with pytest.raises(ValueError):
+        person_list._data_layer.post_init()
+
+
+def test_simplify_filters(engine, client, register_routes, person_list, person_model, person):
+    from sqlalchemy import event
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import (
+        compile_filters, BooleanFilter, FilterCondition, RelationshipFilter,
+    )
+
+    def compile_(*filters):
+        return compile_filters(person_model, list(filters), person_list)
+
+    name = {"name": "name", "op": "eq", "val": "test"}
+    birth_date = {"name": "birth_date", "op": "gt", "val": "2000-01-01T00:00:00"}
+    nothing = {"name": "name", "op": "in_", "val": []}
+    everything = {"name": "name", "op": "notin_", "val": []}
+
+    assert compile_(nothing).empty
+    assert compile_(name, {"and": [birth_date, {"or": [nothing, nothing]}]}).empty
+    assert compile_(everything).trees == ()
+    assert compile_({"not": nothing}).trees == ()
+    assert not compile_({"or": [nothing, name]}).empty
+
+    trees = compile_({"not": {"not": name}}, {"and": [name, {"and": [birth_date, {"or": [name]}]}]}).trees
+    assert [(tree.attribute, tree.op) for tree in trees] == [("name", "eq"), ("birth_date", "gt")]
+    assert all(isinstance(tree, FilterCondition) for tree in trees)
+
+    # filters on a to-one relationship are merged, filters on a to-many relationship only with or
+    city = {"name": "address.city", "op": "eq", "val": "Paris"}
+    street = {"name": "address.street", "op": "eq", "val": "Main street"}
+    (tree,) = compile_(city, street, city).trees
+    assert isinstance(tree, RelationshipFilter) and tree.tree.type_filter == "and" and len(tree.tree.trees) == 2
+    (tree,) = compile_({"or": [city, {"or": [street, nothing]}]}).trees
+    assert isinstance(tree, RelationshipFilter) and tree.tree.type_filter == "or"
+
+    serial = {"name": "computers.serial", "op": "eq", "val": "1"}
+    serial_2 = {"name": "computers.serial", "op": "eq", "val": "2"}
+    assert len(compile_(serial, serial_2).trees) == 2
+    (tree,) = compile_({"or": [serial, serial_2]}).trees
+    assert isinstance(tree, RelationshipFilter) and isinstance(tree.tree, BooleanFilter)
+    assert compile_({"name": "computers", "op": "any", "val": {"name": "serial", "op": "in_", "val": []}}).empty
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with client:
+            querystring = urlencode({"filter": json.dumps([name, {"or": [nothing, {"not": everything}]}])})
+            response = client.get("/persons?" + querystring, content_type="application/vnd.api+json")
+            assert response.status_code == 200, response.json
+            assert response.json["data"] == [] and response.json["meta"]["count"] == 0
+            assert statements == []
+
+            same_id = {"name": "id", "op": "eq", "val": str(person.person_id)}
+            querystring = urlencode({"filter": json.dumps([{"not": {"not": same_id}}, everything])})
+            response = client.get("/persons?" + querystring, content_type="application/vnd.api+json")
+            assert [item["id"] for item in response.json["data"]] == [str(person.person_id)]
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_simplify_relationship_constants(session, client, register_routes, person, computer_model,
+                                         computer_list_resource_with_disable_collection_count, monkeypatch):
+    from flask_combo_jsonapi.data_layers.filtering.alchemy import filters_cache
+
+    computers = [computer_model(serial="constant 1", person=person), computer_model(serial="constant 2")]
+    session.add_all(computers)
+    session.commit()
+    ids = [str(computer_.id) for computer_ in computers]
+    nothing = {"name": "owner.name", "op": "in_", "val": []}
+    scope = {"name": "serial", "op": "like", "val": "constant%"}
+
+    def get(filters):
+        querystring = urlencode({"filter": json.dumps([scope] + filters)})
+        response = client.get("/computers_with_disabled_count?" + querystring, content_type="application/vnd.api+json")
+        assert response.status_code == 200, response.json
+        return sorted(item["id"] for item in response.json["data"])
+
+    # the join of the to-one relationship excludes the computers without owner, even under a not or an or
+    cases = [
+        [{"not": nothing}],
+        [{"or": [nothing, {"name": "serial", "op": "eq", "val": "constant 2"}]}],
+        [{"or": [nothing, scope]}],
+        [{"and": [nothing, scope]}],
+    ]
+    try:
+        with client:
+            filters_cache.clear()
+            results = [get(filters) for filters in cases]
+            assert results == [[ids[0]], [], [ids[0]], []]
+            # same results without compilation nor simplification
+            monkeypatch.setattr(computer_list_resource_with_disable_collection_count._data_layer, "cache_filters",
+                                False, raising=False)
+            assert [get(filters) for filters in cases] == results
+    finally:
+        filters_cache.clear()
+        for computer_ in computers:
+            session.delete(computer_)
+        session.commit()